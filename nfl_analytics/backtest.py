@@ -0,0 +1,128 @@
+"""
+Walk-forward backtest of the spread model. For every week from a start season
+on, the model is trained on all of the weeks before it and predicts that week,
+the way it would have been used at the time. Unlike train_model's random split,
+no later games are ever used to predict an earlier one.
+"""
+
+import os
+from functools import partial
+from typing import List, Optional
+
+import numpy as np
+import pandas as pd
+from sklearn.impute import SimpleImputer
+from sklearn.linear_model import LinearRegression
+from sklearn.preprocessing import StandardScaler
+
+from nfl_analytics.config import BACKTEST_FILENAME
+from nfl_analytics.data import map_seasons
+from nfl_analytics.model import ASSET_DIR, TrainingMatrix
+
+
+def backtest(
+    matrix: TrainingMatrix,
+    start_year: Optional[int] = None,
+    workers: Optional[int] = None,
+) -> pd.DataFrame:
+    """
+    Returns one row per predicted week with the number of games and the mean
+    absolute and squared errors of the predicted spreads. Starts from the second
+    season in the matrix by default, so the first week has a full season to
+    train on.
+
+    Each season's weeks are backtested by one of `workers` processes (defaults
+    to the number of CPUs). Every fold slices the same matrix instead of
+    rebuilding it.
+    """
+    years = np.unique(matrix.year).tolist()
+
+    if start_year is None:
+        start_year = years[1] if len(years) > 1 else years[0]
+
+    years = [year for year in years if year >= start_year]
+
+    if not years:
+        raise ValueError(f"No games from {start_year} or later to backtest.")
+
+    backtest_season = partial(_backtest_season, matrix=matrix)
+    season_results = map_seasons(backtest_season, years, workers)
+
+    return pd.DataFrame(
+        [result for results in season_results for result in results],
+        columns=["year", "week", "games", "mae", "mse"],
+    )
+
+
+def _backtest_season(year: int, matrix: TrainingMatrix) -> List[dict]:
+    results = []
+
+    for (fold_year, week), (start, end) in matrix.get_week_bounds().items():
+        # Rows are sorted by week, so everything before start is the training set
+        if fold_year != year or start == 0:
+            continue
+
+        spreads = fit_and_predict(
+            matrix.X[:start], matrix.y[:start], matrix.X[start:end]
+        )
+        errors = spreads - matrix.y[start:end]
+
+        results.append(
+            {
+                "year": year,
+                "week": week,
+                "games": len(np.unique(matrix.game[start:end])),
+                "mae": float(np.abs(errors).mean()),
+                "mse": float((errors**2).mean()),
+            }
+        )
+
+    return results
+
+
+def fit_and_predict(
+    X_train: np.ndarray, y_train: np.ndarray, X_test: np.ndarray
+) -> np.ndarray:
+    """Trains the model like train_model on all of the given rows and predicts X_test."""
+    # Missing values are filled with the training rows' means only
+    imputer = SimpleImputer(strategy="mean")
+    scaler = StandardScaler()
+    X_train_scaled = scaler.fit_transform(imputer.fit_transform(X_train))
+
+    model = LinearRegression()
+    model.fit(X_train_scaled, y_train)
+
+    return model.predict(scaler.transform(imputer.transform(X_test)))
+
+
+def summarize_backtest(df_backtest: pd.DataFrame) -> pd.DataFrame:
+    """The mean absolute and squared errors of each season's games, and of all of them."""
+    # Weight each week by its number of games
+    df = df_backtest.assign(
+        mae=df_backtest["mae"] * df_backtest["games"],
+        mse=df_backtest["mse"] * df_backtest["games"],
+    )
+    df_seasons = df.groupby("year")[["games", "mae", "mse"]].sum()
+    df_seasons.loc["all"] = df_seasons.sum()
+    df_seasons[["mae", "mse"]] = df_seasons[["mae", "mse"]].div(
+        df_seasons["games"], axis=0
+    )
+
+    return df_seasons.astype({"games": "int64"})
+
+
+def save_backtest(df_backtest: pd.DataFrame, timestamp: int) -> None:
+    os.makedirs(ASSET_DIR, exist_ok=True)
+
+    filename = f"{BACKTEST_FILENAME}-{timestamp}.csv"
+    df_backtest.to_csv(os.path.join(ASSET_DIR, filename), index=False)
+    print(f"Backtest saved to {filename}")
+
+
+if __name__ == "__main__":
+    from nfl_analytics.dataframes import build_training_dataframe
+
+    matrix = TrainingMatrix.from_training_dataframe(build_training_dataframe())
+    df_backtest = backtest(matrix)
+    print(df_backtest.tail())
+    print(summarize_backtest(df_backtest))
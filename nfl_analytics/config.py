@@ -17,6 +17,43 @@ FEATURES = [
     "away_mean_epa_avg",
     "home_mean_epa_avg",
 ]
+# The raw play by play columns used by nfl_analytics.dataframes to build the
+# running averages, and the dtypes they are loaded as. The raw data has ~370
+# columns so only these are loaded.
+PLAY_BY_PLAY_DTYPES = {
+    "game_id": "category",
+    "week": "int8",
+    "home_team": "category",
+    "away_team": "category",
+    "posteam": "category",
+    "defteam": "category",
+    "home_score": "int16",
+    "away_score": "int16",
+    "score_differential_post": "float32",
+    "passing_yards": "float32",
+    "rushing_yards": "float32",
+    "yards_gained": "float32",
+    "sack": "float32",
+    "epa": "float32",
+}
+# Columns containing team abbreviations. They share a single categorical dtype
+# so they can be compared with each other.
+TEAM_COLUMNS = ["home_team", "away_team", "posteam", "defteam"]
+# Team game stats and the names of their running averages
+RUNNING_AVG_COLUMNS = {
+    "rushing_yards": "rushing_avg",
+    "passing_yards": "passing_avg",
+    "yards_gained": "yards_gained_avg",
+    "sack_yards": "sack_yards_avg",
+    "passing_yards_defense": "passing_yards_defense_avg",
+    "rushing_yards_defense": "rushing_yards_defense_avg",
+    "yards_gained_defense": "yards_gained_defense_avg",
+    "sack_yards_defense": "sack_yards_defense_avg",
+    "score_differential_post": "score_differential_post_avg",
+    "points_scored": "points_scored_avg",
+    "points_allowed": "points_allowed_avg",
+    "mean_epa": "mean_epa_avg",
+}
 TEAMS = [
     "WAS",
     "ARI",
@@ -58,6 +95,10 @@ TEAM_ABBR_MAP = {
 }
 
 RUNNING_AVG_DF_FILENAME = "running_average"
+TEAM_SNAPSHOT_FILENAME = "team_snapshot"
 TRAINED_MODEL_FILENAME = "trained_model"
 TRAINED_SCALER_FILENAME = "trained_scaler"
+TRAINED_PARAMS_FILENAME = "trained_params"
+BACKTEST_FILENAME = "backtest"
+SWEEP_FILENAME = "sweep"
 MATCHUPS_FILENAME = "matchups"
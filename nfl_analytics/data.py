@@ -3,56 +3,299 @@ Handles fetching and loading the play by play data. Essentially,
 everything before tranforming it.
 """
 
+import gzip
 import urllib.request
-from urllib.error import HTTPError
+from http.client import HTTPException, HTTPMessage
+from urllib.error import HTTPError, URLError
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import json
 import os
+import shutil
 import sqlite3
-from typing import Iterable
+from typing import BinaryIO, Callable, Iterable, Iterator, List, Optional, TypeVar
 
+import numpy as np
 import pandas as pd
 
 from nfl_analytics.config import (
     DATA_DIR as DATA_DIR_,
     ASSET_DIR as ASSET_DIR_,
+    PLAY_BY_PLAY_DTYPES,
+    TEAM_COLUMNS,
 )
 
 
 THIS_DIR = os.path.dirname(os.path.abspath(__file__))
 ASSET_DIR = os.path.join(THIS_DIR, ASSET_DIR_)
 DATA_DIR = os.path.join(THIS_DIR, DATA_DIR_)
-
-
-def download_data(years: Iterable[int] = range(1999, 2024)) -> None:
+CACHE_DIR = os.path.join(DATA_DIR, "cache")
+# Bump when the layout of cached seasons changes without the dtypes changing
+CACHE_VERSION = 2
+PLAY_BY_PLAY_URL = "https://github.com/nflverse/nflverse-data/releases/download/pbp/"
+# Seasons downloaded at the same time
+DOWNLOAD_WORKERS = 4
+DOWNLOAD_TIMEOUT = 60  # seconds
+# Attempts per season. Interrupted downloads resume where they left off.
+DOWNLOAD_ATTEMPTS = 3
+# Rows parsed at a time when streaming a season
+STREAM_CHUNK_ROWS = 20_000
+
+T = TypeVar("T")
+
+
+def download_data(
+    years: Iterable[int] = range(1999, 2024),
+    base_url: str = PLAY_BY_PLAY_URL,
+    workers: int = DOWNLOAD_WORKERS,
+) -> None:
+    """
+    Downloads the play by play files for the given seasons, several at a time.
+    Files that haven't changed since they were last downloaded are skipped.
+    """
     os.makedirs(DATA_DIR, exist_ok=True)
 
-    for year in years:
-        # year gets parsed from this filename and depends on this format
-        filename = f"play_by_play_{year}.csv.gz"
-        url = f"https://github.com/nflverse/nflverse-data/releases/download/pbp/{filename}"
-        # save_path = os.path.join(data_directory, filename)
+    def download_season_file(url: str, filename: str) -> bool:
         save_path = os.path.join(DATA_DIR, filename)
-
         print(f"Downloading {url} to {save_path}...")
+        return _download_file(url, save_path)
 
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        downloaded = list(
+            executor.map(
+                lambda year: _fetch_season(year, base_url, download_season_file),
+                years,
+            )
+        )
+
+    # Parse the new files once now so loading for training can read from the cache
+    for filename in downloaded:
+        if filename is not None:
+            load_season_dataframe(filename)
+
+
+def stream_data(
+    years: Iterable[int] = range(1999, 2024),
+    base_url: str = PLAY_BY_PLAY_URL,
+    workers: int = DOWNLOAD_WORKERS,
+) -> None:
+    """
+    Like download_data, but each season is parsed while it downloads and only the
+    columns the pipeline uses are saved, straight to the season cache. The raw
+    file is never written to disk or held in memory whole.
+    """
+    os.makedirs(CACHE_DIR, exist_ok=True)
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        list(
+            executor.map(
+                lambda year: _fetch_season(year, base_url, _stream_season_file),
+                years,
+            )
+        )
+
+
+def _fetch_season(
+    year: int, base_url: str, fetch: Callable[[str, str], bool]
+) -> Optional[str]:
+    """
+    Calls fetch with the season's url and filename, retrying if the download
+    fails. Returns the filename if a new version of the season was fetched.
+    """
+    # year gets parsed from this filename and depends on this format
+    filename = f"play_by_play_{year}.csv.gz"
+    url = f"{base_url}{filename}"
+
+    for attempt in range(1, DOWNLOAD_ATTEMPTS + 1):
         try:
-            urllib.request.urlretrieve(url, save_path)
+            if fetch(url, filename):
+                return filename
+
+            print(f"{filename} is up to date")
+            return None
         except HTTPError as e:
-            print(
-                f"Error: Failed to download data for {year}. HTTP Error {e.code}: {e.reason}. Season for that year may not exist yet."
-            )
+            # Server errors may be temporary. A 416 means the partial download didn't
+            # fit the remote file and was removed, so the next attempt starts over.
+            # Anything else won't change by retrying.
+            if e.code < 500 and e.code != 416:
+                print(
+                    f"Error: Failed to download data for {year}. HTTP Error {e.code}: {e.reason}. Season for that year may not exist yet."
+                )
+                return None
+
+            if attempt == DOWNLOAD_ATTEMPTS:
+                print(
+                    f"Error: Failed to download data for {year}. HTTP Error {e.code}: {e.reason}."
+                )
+                return None
+        # A stream that ends early fails with EOFError while decompressing
+        except (URLError, OSError, EOFError, HTTPException) as e:
+            if attempt == DOWNLOAD_ATTEMPTS:
+                print(f"Error: Failed to download data for {year}. {e}")
+                return None
+
+        print(
+            f"Download of {filename} failed, retrying ({attempt}/{DOWNLOAD_ATTEMPTS})..."
+        )
+
+    return None
+
+
+def _download_file(url: str, save_path: str) -> bool:
+    """
+    Downloads url to save_path. Returns False if the file hasn't changed since it
+    was last downloaded.
+
+    The file is downloaded to a .part file which is renamed once it's complete, so
+    save_path is never a partial file. If a previous download was interrupted, it
+    is resumed with a range request as long as the remote file hasn't changed.
+    """
+    part_path = f"{save_path}.part"
+    saved_metadata = _read_download_metadata(save_path)
+    part_metadata = _read_download_metadata(part_path)
+
+    headers = {}
+    if part_metadata is not None and (
+        part_metadata["etag"] or part_metadata["last_modified"]
+    ):
+        headers["Range"] = f"bytes={os.path.getsize(part_path)}-"
+        # If the file changed since, the server sends all of the new file instead
+        headers["If-Range"] = part_metadata["etag"] or part_metadata["last_modified"]
+    elif saved_metadata is not None:
+        if saved_metadata["etag"]:
+            headers["If-None-Match"] = saved_metadata["etag"]
+        if saved_metadata["last_modified"]:
+            headers["If-Modified-Since"] = saved_metadata["last_modified"]
+
+    request = urllib.request.Request(url, headers=headers)
+
+    try:
+        response = urllib.request.urlopen(request, timeout=DOWNLOAD_TIMEOUT)
+    except HTTPError as e:
+        if e.code == 304:
+            return False
+        if e.code == 416:
+            # The partial file doesn't fit the remote file, start over next attempt
+            _remove_download(part_path)
+        raise
+
+    with response:
+        is_resumed = response.status == 206
+        metadata = {
+            "etag": response.headers.get("ETag"),
+            "last_modified": response.headers.get("Last-Modified"),
+            "size": _get_download_size(response),
+        }
+        # Saved before downloading so an interrupted download can be resumed
+        _write_download_metadata(part_path, metadata)
+
+        with open(part_path, "ab" if is_resumed else "wb") as file:
+            shutil.copyfileobj(response, file)
+
+    size = os.path.getsize(part_path)
+    if metadata["size"] is not None and size != metadata["size"]:
+        raise ConnectionError(
+            f"Download incomplete, got {size} of {metadata['size']} bytes"
+        )
+
+    os.replace(part_path, save_path)
+    metadata["size"] = size
+    _write_download_metadata(save_path, metadata)
+    _remove_download_metadata(part_path)
+
+    return True
+
+
+def _stream_season_file(url: str, filename: str) -> bool:
+    """
+    Parses the season at url into the season cache as it downloads. Returns False
+    if the season hasn't changed since it was last streamed.
+    """
+    name = get_season_name(filename)
+    saved_key = _read_streamed_cache_key(name)
+
+    headers = {}
+    if saved_key is not None and saved_key["url"] == url:
+        if saved_key["etag"]:
+            headers["If-None-Match"] = saved_key["etag"]
+        if saved_key["last_modified"]:
+            headers["If-Modified-Since"] = saved_key["last_modified"]
+
+    print(f"Streaming {url} to the season cache...")
+    request = urllib.request.Request(url, headers=headers)
+
+    try:
+        response = urllib.request.urlopen(request, timeout=DOWNLOAD_TIMEOUT)
+    except HTTPError as e:
+        if e.code == 304:
+            return False
+        raise
+
+    with response:
+        cache_key = get_remote_season_cache_key(url, response.headers)
+        df = read_play_by_play_stream(response)
+
+    df = _add_year(df, get_year_from_filename(filename))
+    write_cached_dataframe(CACHE_DIR, name, cache_key, df)
+
+    return True
+
+
+def _get_download_size(response) -> Optional[int]:
+    # A range response's Content-Range is like "bytes 1000-1999/2000"
+    content_range = response.headers.get("Content-Range")
+    if response.status == 206 and content_range is not None:
+        return int(content_range.rsplit("/", 1)[1])
+
+    content_length = response.headers.get("Content-Length")
+    return int(content_length) if content_length is not None else None
+
+
+def _get_download_metadata_path(path: str) -> str:
+    return f"{path}.json"
+
+
+def _read_download_metadata(path: str) -> Optional[dict]:
+    """
+    The response headers of the download saved at path. None if there is no file
+    at path, or it isn't the file the metadata was saved for.
+    """
+    metadata_path = _get_download_metadata_path(path)
+
+    if not (os.path.exists(path) and os.path.exists(metadata_path)):
+        return None
+
+    with open(metadata_path, "r") as file:
+        metadata = json.load(file)
+
+    # A part file is smaller than the full size, but a complete file should match it
+    is_part = path.endswith(".part")
+    if not is_part and metadata["size"] != os.path.getsize(path):
+        return None
+
+    return metadata
+
 
+def _write_download_metadata(path: str, metadata: dict) -> None:
+    with open(_get_download_metadata_path(path), "w") as file:
+        json.dump(metadata, file)
 
-def load_dataframe_from_remote(years: range = range(1999, 2024)) -> pd.DataFrame:
-    combined_df = pd.DataFrame()
 
-    for year in years:
-        url = f"https://github.com/nflverse/nflverse-data/releases/download/pbp/play_by_play_{year}.csv.gz"
-        print(f"Reading from remote: {url}")
-        df = pd.read_csv(url, low_memory=False)
+def _remove_download_metadata(path: str) -> None:
+    metadata_path = _get_download_metadata_path(path)
+    if os.path.exists(metadata_path):
+        os.remove(metadata_path)
 
-        # Save year on dataframe
-        df["year"] = year
-        combined_df = pd.concat([combined_df, df], ignore_index=True)
+
+def _remove_download(path: str) -> None:
+    if os.path.exists(path):
+        os.remove(path)
+    _remove_download_metadata(path)
+
+
+def load_dataframe_from_remote(
+    years: range = range(1999, 2024), workers: Optional[int] = None
+) -> pd.DataFrame:
+    combined_df = concat_play_by_play(list(iter_remote_seasons(years, workers)))
 
     if combined_df.empty:
         raise FileNotFoundError("No data loaded from the remote files.")
@@ -60,42 +303,30 @@ def load_dataframe_from_remote(years: range = range(1999, 2024)) -> pd.DataFrame
     return combined_df
 
 
-def load_dataframe_from_raw() -> pd.DataFrame:
-    if not os.path.exists(DATA_DIR):
-        raise FileNotFoundError(f"Data directory '{DATA_DIR}' not found.")
+def iter_remote_seasons(
+    years: Iterable[int] = range(1999, 2024), workers: Optional[int] = None
+) -> Iterator[pd.DataFrame]:
+    yield from map_seasons(_read_remote_season, list(years), workers)
 
-    files = os.listdir(DATA_DIR)
 
-    if not files:
-        raise FileNotFoundError(f"No data files found in the data directory.")
+def _read_remote_season(year: int) -> pd.DataFrame:
+    url = f"{PLAY_BY_PLAY_URL}play_by_play_{year}.csv.gz"
+    print(f"Reading from remote: {url}")
 
-    # This wont pick on updated data (downlaoded new data but still have combined, so it will use that)
-    # # load saved combined from disk if exists
-    # combined_file_path = os.path.join(
-    #     data_directory, "combined", "play_by_play_combined.parquet.gzip"
-    # )
-    # if not skip_combined and os.path.exists(combined_file_path):
-    #     print(f"Reading combined file {combined_file_path}")
-    #     combined_df = pd.read_parquet(combined_file_path)
-    #     return combined_df
-    # else:
-    #     print("Combined file does not exist. Loading individual files.")
+    with urllib.request.urlopen(url, timeout=DOWNLOAD_TIMEOUT) as response:
+        df = read_play_by_play_stream(response)
 
-    # make combined dataframe from individual files
-    combined_df = pd.DataFrame()
+    # Save year on dataframe
+    return _add_year(df, year)
 
-    for filename in files:
-        if filename.endswith(".csv.gz"):
-            print(f"Reading {filename}")
-            file_path = os.path.join(DATA_DIR, filename)
 
-            # FWIW, low_memory seems to work fine (no model performance change) but it does warn of differing column types
-            df = pd.read_csv(file_path, compression="gzip", low_memory=False)
-
-            # Save year from filename on dataframe
-            year = get_year_from_filename(filename)
-            df["year"] = year
-            combined_df = pd.concat([combined_df, df], ignore_index=True)
+def load_dataframe_from_raw(workers: Optional[int] = None) -> pd.DataFrame:
+    """
+    Loads all downloaded seasons into a single dataframe. Seasons are loaded by
+    `workers` processes (defaults to the number of CPUs) and combined in season order.
+    """
+    # make combined dataframe from individual files (or their cached versions)
+    combined_df = concat_play_by_play(list(iter_raw_seasons(workers)))
 
     if combined_df.empty:
         raise FileNotFoundError("No data loaded from the files.")
@@ -103,6 +334,344 @@ def load_dataframe_from_raw() -> pd.DataFrame:
     return combined_df
 
 
+def iter_raw_seasons(workers: Optional[int] = None) -> Iterator[pd.DataFrame]:
+    """Yields a dataframe for each downloaded or streamed season, in season order."""
+    if not os.path.exists(DATA_DIR):
+        raise FileNotFoundError(f"Data directory '{DATA_DIR}' not found.")
+
+    filenames = get_season_filenames()
+
+    if not filenames:
+        raise FileNotFoundError("No data files found in the data directory.")
+
+    yield from map_seasons(load_season_dataframe, filenames, workers)
+
+
+def map_seasons(
+    fn: Callable[..., T], seasons: List, workers: Optional[int] = None
+) -> Iterator[T]:
+    """
+    Calls fn for each season in a pool of worker processes. Results are yielded
+    in the same order as seasons. With workers=1 everything runs in this process.
+    """
+    if workers == 1 or len(seasons) <= 1:
+        yield from map(fn, seasons)
+        return
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        yield from executor.map(fn, seasons)
+
+
+def get_raw_filenames() -> List[str]:
+    return sorted(
+        filename for filename in os.listdir(DATA_DIR) if filename.endswith(".csv.gz")
+    )
+
+
+def get_season_filenames() -> List[str]:
+    """
+    Filenames of every season that can be loaded: the downloaded raw files plus
+    seasons that were streamed to the cache and have no raw file.
+    """
+    filenames = set(get_raw_filenames())
+
+    if os.path.exists(CACHE_DIR):
+        for cache_filename in os.listdir(CACHE_DIR):
+            name = cache_filename.removesuffix(".json")
+            if (
+                cache_filename.endswith(".json")
+                and f"{name}.csv.gz" not in filenames
+                and _read_streamed_cache_key(name) is not None
+            ):
+                filenames.add(f"{name}.csv.gz")
+
+    return sorted(filenames)
+
+
+def load_season_dataframe(filename: str) -> pd.DataFrame:
+    """
+    Loads a single season's raw play by play file. Reads from the columnar cache
+    when it was built from the current version of the raw file, otherwise parses
+    the raw file and (re)builds the cache for that season.
+    """
+    name = get_season_name(filename)
+    cache_key = get_season_cache_key(filename)
+
+    df = read_cached_dataframe(CACHE_DIR, name, cache_key)
+    if df is not None:
+        return _unify_categories([df])[0]
+
+    df = read_raw_season(filename)
+    write_cached_dataframe(CACHE_DIR, name, cache_key, df)
+
+    return df
+
+
+def read_raw_season(filename: str) -> pd.DataFrame:
+    print(f"Reading {filename}")
+    df = read_play_by_play_csv(os.path.join(DATA_DIR, filename))
+
+    # Save year from filename on dataframe
+    return _add_year(df, get_year_from_filename(filename))
+
+
+def _add_year(df: pd.DataFrame, year: int) -> pd.DataFrame:
+    df["year"] = np.int16(year)
+    return df
+
+
+def read_play_by_play_stream(gzip_stream: BinaryIO) -> pd.DataFrame:
+    """
+    Reads the columns used by the pipeline from a gzipped csv stream (e.g. a
+    response) a chunk at a time, so parsing starts as soon as bytes arrive and the
+    whole file is never held in memory.
+    """
+    with gzip.GzipFile(fileobj=gzip_stream) as csv_stream:
+        chunks = pd.read_csv(
+            csv_stream,
+            usecols=list(PLAY_BY_PLAY_DTYPES),
+            dtype=PLAY_BY_PLAY_DTYPES,
+            chunksize=STREAM_CHUNK_ROWS,
+        )
+
+        with chunks:
+            df = concat_play_by_play(list(chunks))
+
+    if df.empty:
+        raise ValueError("No plays in the play by play stream.")
+
+    return df
+
+
+def read_play_by_play_csv(filepath_or_url: str) -> pd.DataFrame:
+    """Reads only the columns used by the pipeline, as compact dtypes."""
+    df = pd.read_csv(
+        filepath_or_url,
+        compression="gzip",
+        usecols=list(PLAY_BY_PLAY_DTYPES),
+        dtype=PLAY_BY_PLAY_DTYPES,
+    )
+
+    return _unify_categories([df])[0]
+
+
+def categorize_play_by_play(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Plays that weren't read by read_play_by_play_csv (e.g. with a plain
+    pd.read_csv) have plain string columns where it makes categoricals. Converts
+    those, so the team columns share one dtype like they do when read by it.
+    """
+    columns = [
+        column
+        for column, dtype in PLAY_BY_PLAY_DTYPES.items()
+        if dtype == "category"
+        and column in df.columns
+        and not isinstance(df[column].dtype, pd.CategoricalDtype)
+    ]
+
+    if not columns:
+        return df
+
+    df = df.astype({column: "category" for column in columns})
+    return _unify_categories([df])[0]
+
+
+def concat_play_by_play(dfs: List[pd.DataFrame]) -> pd.DataFrame:
+    """
+    Concatenates play by play dataframes, or dataframes built from them like the
+    running averages. Categoricals only stay categorical through pd.concat if
+    every dataframe has the same categories.
+    """
+    dfs = [df for df in dfs if not df.empty]
+
+    if not dfs:
+        return pd.DataFrame()
+
+    return pd.concat(_unify_categories(dfs), ignore_index=True)
+
+
+def _unify_categories(dfs: List[pd.DataFrame]) -> List[pd.DataFrame]:
+    categorical_columns = [
+        column
+        for column, dtype in dfs[0].dtypes.items()
+        if isinstance(dtype, pd.CategoricalDtype)
+    ]
+    # Team columns share one dtype so they can be compared to each other. Running
+    # averages also have the team each row is for.
+    team_columns = [
+        column
+        for column in categorical_columns
+        if column in TEAM_COLUMNS or column == "team"
+    ]
+    column_groups = [team_columns] + [
+        [column] for column in categorical_columns if column not in team_columns
+    ]
+
+    for columns in column_groups:
+        categories = set()
+        for df in dfs:
+            for column in columns:
+                categories.update(df[column].cat.categories)
+        categories = sorted(categories)
+
+        # astype would treat dtypes with the same categories in a different
+        # order as equal and keep the unsorted order (e.g. from parquet)
+        dfs = [
+            df.assign(
+                **{
+                    column: df[column].cat.set_categories(categories)
+                    for column in columns
+                }
+            )
+            for df in dfs
+        ]
+
+    return dfs
+
+
+def get_season_cache_key(filename: str) -> dict:
+    if not os.path.exists(os.path.join(DATA_DIR, filename)):
+        # Streamed seasons have no raw file and are keyed by the remote file instead
+        cache_key = _read_streamed_cache_key(get_season_name(filename))
+        if cache_key is None:
+            raise FileNotFoundError(f"{filename} has not been downloaded or streamed.")
+        return cache_key
+
+    # Re-downloading a season replaces the file, which changes its mtime (and usually size)
+    stat = os.stat(os.path.join(DATA_DIR, filename))
+    # The cache is also stale if the columns or dtypes we load change
+    return {
+        "size": stat.st_size,
+        "mtime_ns": stat.st_mtime_ns,
+        "dtypes": PLAY_BY_PLAY_DTYPES,
+        "version": CACHE_VERSION,
+    }
+
+
+def get_remote_season_cache_key(url: str, headers: HTTPMessage) -> dict:
+    return {
+        "url": url,
+        "etag": headers.get("ETag"),
+        "last_modified": headers.get("Last-Modified"),
+        "dtypes": PLAY_BY_PLAY_DTYPES,
+        "version": CACHE_VERSION,
+    }
+
+
+def _read_streamed_cache_key(name: str) -> Optional[dict]:
+    """
+    The key a streamed season was cached with, if it's cached and still has the
+    columns and dtypes we load.
+    """
+    cache_key = _read_cache_key(_get_cache_path(CACHE_DIR, name))
+
+    if cache_key is None:
+        return None
+
+    if (
+        "url" not in cache_key
+        or cache_key["dtypes"] != PLAY_BY_PLAY_DTYPES
+        or cache_key["version"] != CACHE_VERSION
+    ):
+        return None
+
+    return cache_key
+
+
+def get_season_name(filename: str) -> str:
+    # Expects filename like play_by_play_2020.csv.gz
+    return filename.removesuffix(".csv.gz")
+
+
+def read_cached_dataframe(
+    cache_dir: str, name: str, cache_key: dict
+) -> Optional[pd.DataFrame]:
+    """Reads a cached dataframe if it was saved with the same cache key."""
+    return read_cached_file(
+        _get_cache_path(cache_dir, name), cache_key, pd.read_parquet, name
+    )
+
+
+def read_stale_cached_dataframe(cache_dir: str, name: str) -> Optional[pd.DataFrame]:
+    """Reads a cached dataframe whatever key it was saved with, e.g. to update it."""
+    parquet_path = _get_cache_path(cache_dir, name)
+
+    if _read_cache_key(parquet_path) is None:
+        return None
+
+    return pd.read_parquet(parquet_path)
+
+
+def write_cached_dataframe(
+    cache_dir: str, name: str, cache_key: dict, df: pd.DataFrame
+) -> None:
+    try:
+        write_cached_file(
+            _get_cache_path(cache_dir, name),
+            cache_key,
+            lambda path: df.to_parquet(path, index=False),
+        )
+    except (ValueError, TypeError) as e:
+        print(f"Warning: Could not cache {name}: {e}")
+
+
+def read_cached_file(
+    path: str, cache_key: dict, read: Callable[[str], T], name: str
+) -> Optional[T]:
+    """
+    Reads the file cached at path with read if it was saved with the same cache
+    key (see write_cached_file). None if it wasn't or there is no file.
+    """
+    saved_key = _read_cache_key(path)
+
+    if saved_key is None:
+        return None
+
+    if saved_key != cache_key:
+        print(f"Cache for {name} is stale")
+        return None
+
+    print(f"Reading {name} from cache")
+    return read(path)
+
+
+def write_cached_file(path: str, cache_key: dict, write: Callable[[str], None]) -> None:
+    """
+    Caches a file by calling write with path, and saves the cache key next to it
+    (as .json instead of the file's extension) once it's written.
+    """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    key_path = _get_key_path(path)
+
+    # Remove the key first so an interrupted write is never mistaken for a valid cache
+    if os.path.exists(key_path):
+        os.remove(key_path)
+
+    write(path)
+
+    with open(key_path, "w") as file:
+        json.dump(cache_key, file)
+
+
+def _read_cache_key(path: str) -> Optional[dict]:
+    """The key the file at path was cached with. None if it isn't cached."""
+    key_path = _get_key_path(path)
+
+    if not (os.path.exists(path) and os.path.exists(key_path)):
+        return None
+
+    with open(key_path, "r") as file:
+        return json.load(file)
+
+
+def _get_cache_path(cache_dir: str, name: str) -> str:
+    return os.path.join(cache_dir, f"{name}.parquet")
+
+
+def _get_key_path(path: str) -> str:
+    return f"{os.path.splitext(path)[0]}.json"
+
+
 def get_year_from_filename(filename: str) -> int:
     # Expects filename like play_by_play_2020.csv.gz
     return int(filename[-11:-7])
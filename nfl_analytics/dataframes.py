@@ -1,14 +1,39 @@
 """
 Builds the dataframes used for training and prediction.
 Handles everything between getting the data and training/using the model.
+
+Functions here never modify the dataframes passed to them. They return new
+dataframes that belong to the caller. Where a result reuses columns of its
+input, the columns are shared instead of copied when pandas' copy-on-write
+mode is on (main.py turns it on), and copied when it's off.
 """
 
-from typing import Optional
+import os
+from functools import partial
+from typing import List, Optional
 
+import numpy as np
 import pandas as pd
-from pandas.core.groupby.generic import DataFrameGroupBy
 
-from nfl_analytics.data import load_dataframe_from_raw
+from nfl_analytics.config import RUNNING_AVG_COLUMNS
+from nfl_analytics.data import (
+    CACHE_DIR,
+    categorize_play_by_play,
+    concat_play_by_play,
+    map_seasons,
+    load_season_dataframe,
+    get_season_filenames,
+)
+
+RUNNING_AVG_CACHE_DIR = os.path.join(CACHE_DIR, "running_average")
+# Bump when changes to the pipeline change the running averages, so that
+# running averages saved by the incremental build are rebuilt.
+RUNNING_AVG_CACHE_VERSION = 3
+# Stats summed for each team's plays on offense, and again for its plays on defense
+GAME_STAT_COLUMNS = ["passing_yards", "rushing_yards", "yards_gained", "sack_yards"]
+# Rough peak memory of loading one season and reducing it to running averages. Used
+# to decide how many seasons can be loaded at once within a memory budget.
+SEASON_MEMORY_MB = 512
 
 
 def build_training_dataframe(
@@ -17,14 +42,12 @@ def build_training_dataframe(
     if df_running_avg is None:
         df_running_avg = build_running_avg_dataframe()
 
-    # Create a new column 'is_home' to indicate whether the team is playing at home
-    df_running_avg["is_home"] = df_running_avg.apply(
-        lambda row: True if row["team"] == row["home_team"] else False, axis=1
-    )
+    # Whether the team is playing at home. Kept out of df_running_avg so it isn't modified.
+    is_home = (df_running_avg["team"] == df_running_avg["home_team"]).rename("is_home")
 
     # Group by game_id and is_home and aggregate using the first value
     squashed_df = (
-        df_running_avg.groupby(["game_id", "is_home"])[
+        df_running_avg.groupby([df_running_avg["game_id"], is_home], observed=True)[
             [
                 "rushing_avg",
                 "passing_avg",
@@ -67,177 +90,300 @@ def build_training_dataframe(
     )
 
 
-def build_running_avg_dataframe(df_raw: Optional[pd.DataFrame] = None) -> pd.DataFrame:
+def build_running_avg_dataframe(
+    df_raw: Optional[pd.DataFrame] = None,
+    window: Optional[int] = None,
+    workers: Optional[int] = None,
+    memory_budget_mb: Optional[int] = None,
+) -> pd.DataFrame:
     """
     Builds a dataframe with weakly running averages for each team by year.
-    Used to create prediction inputs and build the training dataset
+    Used to create prediction inputs and build the training dataset.
+    By default the averages are over all of the team's previous games that
+    season. Pass window to only average the team's last `window` games.
+
+    Without df_raw, each downloaded season is built on its own and only the
+    running averages are combined (see build_running_avg_dataframe_by_season),
+    instead of loading every season's plays at once.
     """
     if df_raw is None:
-        df_raw = load_dataframe_from_raw()
-
-    df_sacks = add_sack_yards(df_raw)
-    # df_game is team games stats by team: week 1, DET, 250 pass, 120 run, etc.
-    df_game_posteam = df_sacks.groupby(["game_id", "posteam"])
-    df_game = aggregate_game_stats(df_sacks, df_game_posteam)
-    df_game = adjust_game_dataframe(df_game, df_game_posteam)
-    df_running_avg = df_game[
-        [
-            "game_id",
-            "team",
-            "week",
-            "year",
-            "home_team",
-            "away_team",
-            "score_differential_post",
-        ]
-    ].copy()
+        return build_running_avg_dataframe_by_season(window, workers, memory_budget_mb)
 
-    # Set the home_spread
-    # This will be our target variable. It's the spread relative to the home team. We want this because we need to predict a single spread value (which we can then invert for the away team's spread).
-    df_running_avg["home_spread"] = df_game.apply(
-        lambda row: (
-            -row["score_differential_post"]
-            if row["team"] != row["home_team"]
-            else row["score_differential_post"]
-        ),
-        axis=1,
-    )
+    df_game = build_game_dataframe(df_raw)
+
+    df_running_avg = select_game_results(df_game)
 
     # Get the running average for each team by team and year
-    # Uses lambda and shift to not include current row in running average
-    # Expand is an expanding window function that gets everything from the first to current row
-    df_running_avg[
-        [
-            "rushing_avg",
-            "passing_avg",
-            "yards_gained_avg",
-            "sack_yards_avg",
-            "passing_yards_defense_avg",
-            "rushing_yards_defense_avg",
-            "yards_gained_defense_avg",
-            "sack_yards_defense_avg",
-            "score_differential_post_avg",
-            "points_scored_avg",
-            "points_allowed_avg",
-            "mean_epa_avg",
-        ]
-    ] = (
-        df_game.groupby(["team", "year"])[
-            [
-                "rushing_yards",
-                "passing_yards",
-                "yards_gained",
-                "sack_yards",
-                "passing_yards_defense",
-                "rushing_yards_defense",
-                "yards_gained_defense",
-                "sack_yards_defense",
-                "score_differential_post",
-                "points_scored",
-                "points_allowed",
-                "mean_epa",
-            ]
-        ]
-        .apply(lambda x: x.shift().expanding().mean())
-        .reset_index(level=[0, 1], drop=True)
-    )
+    df_running_avg[list(RUNNING_AVG_COLUMNS.values())] = running_mean(
+        df_game, ["team", "year"], list(RUNNING_AVG_COLUMNS), window
+    ).to_numpy()
 
     return df_running_avg
 
 
-def add_sack_yards(df_raw: pd.DataFrame) -> pd.DataFrame:
-    df = df_raw.copy()
-    # Sack yards would be necessary to get accurate TEAM passing stats.
-    # Team passing yards are sum(passing_yards) - sum(sack_yards)
-    # Player passing stats are simply sum(passing_yards).
-    df["sack_yards"] = pd.NA
+def running_mean(
+    df: pd.DataFrame, by: List[str], columns: List[str], window: Optional[int] = None
+) -> pd.DataFrame:
+    """
+    Mean of each column over the previous rows of each group, not including the
+    current row. With window=None the mean is over all previous rows, which is
+    the same as x.shift().expanding().mean() for each group. With window=n it is
+    over (up to) the previous n rows. Missing values are skipped and the mean is
+    NaN when there are no previous values.
+
+    All groups and columns are computed at once from grouped cumulative sums
+    and counts rather than applying a function to each group.
+    """
+    keys = [df[column] for column in by]
+    values = df[columns].astype("float64")
 
-    # Set sack_yards to yards_gained for rows where sack is not equal to 0
-    df.loc[df["sack"] != 0, "sack_yards"] = df["yards_gained"]
+    # cumsum leaves missing values missing without adding them to the sum, so
+    # fill those rows with the sum so far (or 0 if there is nothing so far)
+    sums = values.groupby(keys, observed=True).cumsum()
+    sums = sums.groupby(keys, observed=True).ffill().fillna(0)
+    counts = values.notna().groupby(keys, observed=True).cumsum()
 
-    return df
+    if window is not None:
+        sums -= sums.groupby(keys, observed=True).shift(window, fill_value=0)
+        counts -= counts.groupby(keys, observed=True).shift(window, fill_value=0)
 
+    # Shift so each row only has the sums and counts of the rows before it
+    sums = sums.groupby(keys, observed=True).shift()
+    counts = counts.groupby(keys, observed=True).shift()
 
-def aggregate_game_stats(
-    df_sacks: pd.DataFrame, df_game_posteam: DataFrameGroupBy
-) -> pd.DataFrame:
-    # Group by game and team and combine offensive and defensive stats into single record
+    return sums / counts.where(counts > 0)
 
-    # Separate offensive and defensive stats
-    offensive_stats = (
-        df_game_posteam[
-            ["passing_yards", "rushing_yards", "yards_gained", "sack_yards"]
-        ]
-        .sum()
-        .reset_index()
+
+def build_game_dataframe(df_raw: pd.DataFrame) -> pd.DataFrame:
+    """
+    Aggregates plays into team game stats, one row per team per game:
+    week 1, DET, 250 pass, 120 run, etc.
+
+    Plays are grouped by (game, posteam) once and every column is computed from
+    those groups: offense and defense sums, scores, the final score differential
+    and mean EPA. A team's defensive stats are the sums of the plays where it is
+    defteam, added to the team's (game, posteam) group. Games where a team only
+    shows up on one side of the ball are dropped.
+    """
+    df_raw = categorize_play_by_play(df_raw)
+
+    teams = df_raw["posteam"].cat.categories
+    game_codes = df_raw["game_id"].cat.codes.to_numpy().astype(np.int64)
+    posteam_codes = df_raw["posteam"].cat.codes.to_numpy()
+    defteam_codes = df_raw["defteam"].cat.set_categories(teams).cat.codes.to_numpy()
+
+    # Key each play by its game and team, so groups sort by game and then team
+    key_count = len(df_raw["game_id"].cat.categories) * len(teams)
+    offense_rows = np.flatnonzero(posteam_codes >= 0)
+    offense_keys = game_codes[offense_rows] * len(teams) + posteam_codes[offense_rows]
+    defense_rows = np.flatnonzero(defteam_codes >= 0)
+    defense_keys = game_codes[defense_rows] * len(teams) + defteam_codes[defense_rows]
+
+    # Number the (game, posteam) groups, and look up each play's groups by key.
+    # Keys that aren't an offense group (-1) are defense without offense.
+    group_sizes = np.bincount(offense_keys, minlength=key_count)
+    group_keys = np.flatnonzero(group_sizes)
+    group_sizes = group_sizes[group_keys]
+    group_count = len(group_keys)
+    key_groups = np.full(key_count, -1, dtype=np.int64)
+    key_groups[group_keys] = np.arange(group_count)
+
+    groups = key_groups[offense_keys]
+    defense_groups = key_groups[defense_keys]
+    defense_rows = defense_rows[defense_groups >= 0]
+    defense_groups = defense_groups[defense_groups >= 0]
+
+    # The plays of each group, in their original order
+    order = offense_rows[np.argsort(groups, kind="stable")]
+    ends = np.cumsum(group_sizes)
+    starts = ends - group_sizes
+    first_rows = order[starts]
+    last_rows = order[ends - 1]
+
+    columns = {
+        "game_id": pd.Categorical.from_codes(
+            group_keys // len(teams), dtype=df_raw["game_id"].dtype
+        )
+    }
+
+    stats = {column: _get_stat(df_raw, column) for column in GAME_STAT_COLUMNS}
+    for column, values in stats.items():
+        columns[column] = _group_sum(values[offense_rows], groups, group_count)
+
+    columns["team"] = pd.Categorical.from_codes(
+        group_keys % len(teams), dtype=df_raw["posteam"].dtype
     )
-    defensive_stats = (
-        df_sacks.groupby(["game_id", "defteam"])[
-            ["passing_yards", "rushing_yards", "yards_gained", "sack_yards"]
-        ]
-        .sum()
-        .reset_index()
+
+    for column, values in stats.items():
+        columns[f"{column}_defense"] = _group_sum(
+            values[defense_rows], defense_groups, group_count
+        )
+
+    # These are the same for every play in a game
+    for column in ["home_team", "away_team", "home_score", "away_score"]:
+        columns[column] = df_raw[column].array[first_rows]
+
+    is_home = columns["team"] == columns["home_team"]
+    columns["points_scored"] = np.where(
+        is_home, columns["home_score"], columns["away_score"]
+    )
+    columns["points_allowed"] = np.where(
+        is_home, columns["away_score"], columns["home_score"]
     )
 
-    # Rename columns for defensive stats to distinguish them
-    defensive_stats.rename(
-        columns={
-            "defteam": "team",
-            "passing_yards": "passing_yards_defense",
-            "rushing_yards": "rushing_yards_defense",
-            "yards_gained": "yards_gained_defense",
-            "sack_yards": "sack_yards_defense",
-        },
-        inplace=True,
+    # The last play of the game that has a score differential
+    score_differential_post = df_raw["score_differential_post"].to_numpy()[order]
+    last_valid = _get_last_valid(~np.isnan(score_differential_post), starts, ends)
+    columns["score_differential_post"] = np.where(
+        last_valid >= 0,
+        score_differential_post[np.maximum(last_valid, 0)],
+        np.float32(np.nan),
     )
 
-    return pd.merge(
-        offensive_stats,
-        defensive_stats,
-        left_on=["game_id", "posteam"],
-        right_on=["game_id", "team"],
+    for column in ["week", "year"]:
+        columns[column] = df_raw[column].array[last_rows]
+
+    columns["mean_epa"] = _group_mean(
+        df_raw["epa"].to_numpy()[order], starts, group_sizes
     )
 
+    # Teams that were never on defense in a game have no defensive stats
+    has_defense = np.bincount(defense_groups, minlength=group_count) > 0
 
-def adjust_game_dataframe(df_game: pd.DataFrame, df_game_posteam: DataFrameGroupBy):
-    df = df_game.copy()
+    return pd.DataFrame(columns)[has_defense].reset_index(drop=True)
 
-    # Add home_team, away_team, home_score, away_score
-    df[["home_team", "away_team", "home_score", "away_score"]] = (
-        df_game_posteam[["home_team", "away_team", "home_score", "away_score"]]
-        .first()
-        .reset_index(drop=True)
-    )
 
-    df["points_scored"] = df.apply(
-        lambda row: (
-            row["home_score"]
-            if row["posteam"] == row["home_team"]
-            else row["away_score"]
-        ),
-        axis=1,
-    )
-    df["points_allowed"] = df.apply(
-        lambda row: (
-            row["away_score"]
-            if row["posteam"] == row["home_team"]
-            else row["home_score"]
-        ),
-        axis=1,
+def _get_stat(df_raw: pd.DataFrame, column: str) -> np.ndarray:
+    if column != "sack_yards":
+        return df_raw[column].to_numpy()
+
+    # Sack yards would be necessary to get accurate TEAM passing stats.
+    # Team passing yards are sum(passing_yards) - sum(sack_yards)
+    # Player passing stats are simply sum(passing_yards).
+    # sack_yards is yards_gained for rows where sack is not equal to 0
+    yards_gained = df_raw["yards_gained"].to_numpy()
+    return np.where(df_raw["sack"].to_numpy() != 0, yards_gained, np.nan).astype(
+        yards_gained.dtype
     )
 
-    df.drop(["posteam"], axis=1, inplace=True)
 
-    # sets score differential to last value for each game and team
-    df[["score_differential_post", "week", "year"]] = (
-        df_game_posteam[["score_differential_post", "week", "year"]]
-        .last()
-        .reset_index(drop=True)
+def _group_sum(values: np.ndarray, groups: np.ndarray, group_count: int) -> np.ndarray:
+    """Sums values by group, skipping missing values. Keeps the dtype of values."""
+    weights = np.where(np.isnan(values), 0, values)
+    sums = np.bincount(groups, weights=weights, minlength=group_count)
+    return sums.astype(values.dtype)
+
+
+def _group_mean(
+    values: np.ndarray, starts: np.ndarray, group_sizes: np.ndarray
+) -> np.ndarray:
+    """
+    Mean of each group of values (sorted by group), skipping missing values.
+    Sums are compensated in the dtype of values like pandas' groupby mean, so
+    float32 means are exactly the same as pandas'. Adds the nth value of every
+    group at once, so there is one step per play in the largest group.
+    """
+    sums = np.zeros(len(starts), dtype=values.dtype)
+    compensations = np.zeros(len(starts), dtype=values.dtype)
+    counts = np.zeros(len(starts), dtype=np.int64)
+
+    for offset in range(group_sizes.max(initial=0)):
+        groups = np.flatnonzero(group_sizes > offset)
+        group_values = values[starts[groups] + offset]
+        is_valid = ~np.isnan(group_values)
+        groups = groups[is_valid]
+
+        y = group_values[is_valid] - compensations[groups]
+        t = sums[groups] + y
+        compensations[groups] = t - sums[groups] - y
+        sums[groups] = t
+        counts[groups] += 1
+
+    with np.errstate(invalid="ignore"):
+        return sums / counts.astype(values.dtype)
+
+
+def _get_last_valid(
+    is_valid: np.ndarray, starts: np.ndarray, ends: np.ndarray
+) -> np.ndarray:
+    """Position of the last valid value in each group, or -1 if there isn't one."""
+    valid_positions = np.flatnonzero(is_valid)
+    last = np.searchsorted(valid_positions, ends) - 1
+    in_group = last >= 0
+    in_group[in_group] = valid_positions[last[in_group]] >= starts[in_group]
+
+    return np.where(in_group, valid_positions[np.maximum(last, 0)], -1)
+
+
+def build_running_avg_dataframe_by_season(
+    window: Optional[int] = None,
+    workers: Optional[int] = None,
+    memory_budget_mb: Optional[int] = None,
+) -> pd.DataFrame:
+    """
+    Builds the same dataframe as build_running_avg_dataframe(load_dataframe_from_raw())
+    without ever combining seasons' plays. Games never span seasons and running
+    averages reset every season, so each worker takes one season's raw file all
+    the way to its running averages. Only those (small) partitions are sent
+    back and concatenated. Peak memory is one season per worker plus the
+    running averages, rather than all of the plays.
+
+    Seasons are processed by `workers` processes (defaults to the number of
+    CPUs). With memory_budget_mb, fewer seasons are loaded at once if needed to
+    stay within the budget.
+    """
+    filenames = get_season_filenames()
+
+    if not filenames:
+        raise FileNotFoundError("No data files found in the data directory.")
+
+    if memory_budget_mb is not None:
+        workers = get_workers_for_memory_budget(memory_budget_mb, workers)
+
+    build_season = partial(_build_season_running_avg, window=window)
+
+    return concat_play_by_play(list(map_seasons(build_season, filenames, workers)))
+
+
+def _build_season_running_avg(
+    filename: str, window: Optional[int] = None
+) -> pd.DataFrame:
+    return build_running_avg_dataframe(load_season_dataframe(filename), window)
+
+
+def get_workers_for_memory_budget(
+    memory_budget_mb: int, workers: Optional[int] = None
+) -> int:
+    """Most seasons that can be loaded at once within the memory budget, at least 1."""
+    max_workers = workers or os.cpu_count() or 1
+    return max(1, min(max_workers, memory_budget_mb // SEASON_MEMORY_MB))
+
+
+def select_game_results(df_game: pd.DataFrame) -> pd.DataFrame:
+    """Selects the columns of the running average dataframe that describe the game itself."""
+    df_results = pd.DataFrame(
+        {
+            column: df_game[column]
+            for column in [
+                "game_id",
+                "team",
+                "week",
+                "year",
+                "home_team",
+                "away_team",
+                "score_differential_post",
+            ]
+        }
     )
 
-    df["mean_epa"] = df_game_posteam["epa"].mean().reset_index(drop=True)
+    # Set the home_spread
+    # This will be our target variable. It's the spread relative to the home team. We want this because we need to predict a single spread value (which we can then invert for the away team's spread).
+    score_differential_post = df_game["score_differential_post"].astype("float64")
+    df_results["home_spread"] = score_differential_post.where(
+        df_game["team"] == df_game["home_team"], -score_differential_post
+    )
 
-    return df
+    return df_results
 
 
 if __name__ == "__main__":
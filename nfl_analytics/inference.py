@@ -0,0 +1,258 @@
+"""
+Predicts spreads from what --train saves, using only numpy. Nothing here
+imports pandas or scikit-learn, so predicting from the CLI doesn't pay for
+loading them.
+"""
+
+import json
+import os
+import time
+from dataclasses import dataclass, asdict
+from typing import TYPE_CHECKING, List, Optional, Union
+
+import numpy as np
+from numpy import ndarray
+
+from nfl_analytics.schedule import Matchup
+from nfl_analytics.config import (
+    FEATURES,
+    RUNNING_AVG_COLUMNS,
+    TEAMS,
+    ASSET_DIR as ASSET_DIR_,
+)
+
+if TYPE_CHECKING:
+    import pandas as pd
+    from sklearn.linear_model import LinearRegression
+    from sklearn.preprocessing import StandardScaler
+
+    from nfl_analytics.model import RunningAvgLookup
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+ASSET_DIR = os.path.join(SCRIPT_DIR, ASSET_DIR_)
+
+
+@dataclass
+class Prediction:
+    home_team: str
+    away_team: str
+    spread: float
+
+
+@dataclass
+class TeamSnapshot:
+    """
+    Each team's latest running averages as of a year and week: the only rows
+    predictions for upcoming games need. A team on bye that week has its
+    averages from its last game week before that.
+
+    Has the same interface as RunningAvgLookup for its as of week, so it can be
+    passed to predict, predict_many and make_matchup.
+    """
+
+    teams: List[str]
+    # One row per team, one column per running average
+    values: ndarray
+    year: int
+    week: int
+
+    def __post_init__(self):
+        self.columns = list(RUNNING_AVG_COLUMNS.values())
+        self._rows = {team: row for row, team in enumerate(self.teams)}
+
+    @property
+    def latest_year(self) -> int:
+        return self.year
+
+    @classmethod
+    def from_dataframe(cls, df_running_avg: "pd.DataFrame") -> "TeamSnapshot":
+        year = int(df_running_avg["year"].max())
+        df_year = df_running_avg[df_running_avg["year"] == year]
+        week = int(df_year["week"].max())
+
+        df_latest = df_year.sort_values("week", kind="stable").drop_duplicates(
+            "team", keep="last"
+        )
+        values = (
+            df_latest.set_index(df_latest["team"].astype(str))[
+                list(RUNNING_AVG_COLUMNS.values())
+            ]
+            .reindex(TEAMS)
+            .to_numpy(dtype="float64")
+        )
+
+        return cls(list(TEAMS), values, year, week)
+
+    @classmethod
+    def load(cls, path: str) -> "TeamSnapshot":
+        with np.load(path) as snapshot:
+            if list(snapshot["columns"]) != list(RUNNING_AVG_COLUMNS.values()):
+                raise ValueError(f"{path} has different running averages than expected")
+
+            year, week = snapshot["as_of"].tolist()
+            return cls(snapshot["teams"].tolist(), snapshot["values"], year, week)
+
+    def save(self, path: str) -> None:
+        np.savez(
+            path,
+            teams=np.array(self.teams),
+            columns=np.array(self.columns),
+            values=self.values,
+            as_of=np.array([self.year, self.week]),
+        )
+
+    def last_week(self, year: int) -> int:
+        if year != self.year:
+            raise KeyError(year)
+
+        return self.week
+
+    def get(self, year: int, week: int, team: str) -> ndarray:
+        """The team's latest running averages. All NaN if the team has none that year."""
+        if (year, week) != (self.year, self.week):
+            raise ValueError(
+                f"Snapshot only has running averages as of {self.year} week {self.week}"
+            )
+
+        row = self._rows.get(team)
+
+        if row is None:
+            return np.full(len(self.columns), np.nan)
+
+        return self.values[row]
+
+
+@dataclass
+class LinearModelParams:
+    """
+    Everything the trained scaler and linear model do to predict, as arrays:
+    ((x - mean) / scale) @ coef + intercept for each row x of FEATURES.
+    """
+
+    mean: ndarray
+    scale: ndarray
+    coef: ndarray
+    intercept: float
+
+    @classmethod
+    def from_estimators(
+        cls, model: "LinearRegression", scaler: "StandardScaler"
+    ) -> "LinearModelParams":
+        feature_count = len(FEATURES)
+        mean = scaler.mean_ if scaler.mean_ is not None else np.zeros(feature_count)
+        scale = scaler.scale_ if scaler.scale_ is not None else np.ones(feature_count)
+
+        return cls(mean, scale, model.coef_, float(model.intercept_))
+
+    @classmethod
+    def load(cls, path: str) -> "LinearModelParams":
+        with np.load(path) as params:
+            if list(params["features"]) != FEATURES:
+                raise ValueError(
+                    f"{path} was trained on different features than expected"
+                )
+
+            return cls(
+                params["mean"],
+                params["scale"],
+                params["coef"],
+                float(params["intercept"]),
+            )
+
+    def save(self, path: str) -> None:
+        np.savez(
+            path,
+            features=np.array(FEATURES),
+            mean=self.mean,
+            scale=self.scale,
+            coef=self.coef,
+            intercept=np.array(self.intercept),
+        )
+
+    def predict(self, matchup_matrix: ndarray) -> ndarray:
+        # Same operations as StandardScaler.transform and LinearRegression.predict
+        scaled = (matchup_matrix - self.mean) / self.scale
+        return scaled @ self.coef + self.intercept
+
+
+def get_matchup_matrix(
+    running_avg: Union["TeamSnapshot", "RunningAvgLookup"],
+    matchups: List[Matchup],
+    week: Optional[int] = None,
+    year: Optional[int] = None,
+) -> ndarray:
+    """One row of FEATURES per matchup, from each team's running averages for the week."""
+    if year is None:
+        year = running_avg.latest_year
+
+    if week is None:
+        week = running_avg.last_week(year)
+
+    columns = [f"home_{col}" for col in running_avg.columns] + [
+        f"away_{col}" for col in running_avg.columns
+    ]
+    feature_indexes = [columns.index(feature) for feature in FEATURES]
+
+    matchup_matrix = np.array(
+        [
+            np.concatenate(
+                [
+                    running_avg.get(year, week, matchup.home_team),
+                    running_avg.get(year, week, matchup.away_team),
+                ]
+            )
+            for matchup in matchups
+        ]
+    )
+
+    return matchup_matrix[:, feature_indexes]
+
+
+def predict_spreads(
+    params: LinearModelParams,
+    running_avg: Union["TeamSnapshot", "RunningAvgLookup"],
+    matchups: List[Matchup],
+    week: Optional[int] = None,
+    year: Optional[int] = None,
+) -> List[Prediction]:
+    """
+    Raises ValueError if a team is missing any of the running averages the model
+    uses, which the scikit-learn model would too rather than predicting NaN.
+    """
+    if not matchups:
+        return []
+
+    matchup_matrix = get_matchup_matrix(running_avg, matchups, week, year)
+
+    if np.isnan(matchup_matrix).any():
+        _raise_missing_features(matchup_matrix, matchups)
+
+    spreads = params.predict(matchup_matrix)
+
+    return [
+        Prediction(matchup.home_team, matchup.away_team, spread)
+        for matchup, spread in zip(matchups, spreads.tolist())
+    ]
+
+
+def _raise_missing_features(matchup_matrix: ndarray, matchups: List[Matchup]) -> None:
+    for matchup, row in zip(matchups, matchup_matrix):
+        missing = [feature for feature, value in zip(FEATURES, row) if np.isnan(value)]
+        if not missing:
+            continue
+
+        team = (
+            matchup.home_team if missing[0].startswith("home_") else matchup.away_team
+        )
+        raise ValueError(f"{team} has no running averages for: {', '.join(missing)}")
+
+
+def save_predictions(predictions: List[Prediction]) -> None:
+    os.makedirs(ASSET_DIR, exist_ok=True)
+
+    filepath = os.path.join(ASSET_DIR, f"predictions-{int(time.time())}.json")
+    with open(filepath, "w") as json_file:
+        predictions_dict = [asdict(p) for p in predictions]
+        json.dump(predictions_dict, json_file)
+
+    print(f"Predictions saved to {filepath}")
@@ -1,31 +1,7 @@
 import argparse
 import time
-from typing import List
+from typing import TYPE_CHECKING, List, Optional, Union
 
-import pandas as pd
-from joblib import load
-
-from nfl_analytics.data import (
-    download_data,
-    load_dataframe_from_raw,
-    save_dataframe,
-)
-from nfl_analytics.model import (
-    train_model,
-    predict,
-    save_model_and_scaler,
-    Prediction,
-    save_predictions,
-)
-from nfl_analytics.dataframes import (
-    build_running_avg_dataframe,
-    build_training_dataframe,
-)
-from nfl_analytics.schedule import (
-    get_upcoming_matchups,
-    save_upcoming_matchups,
-    load_matchups,
-)
 from nfl_analytics.utils import (
     is_valid_year,
     get_latest_timestamped_filepath,
@@ -34,21 +10,116 @@ from nfl_analytics.utils import (
 from nfl_analytics.config import (
     TEAMS,
     RUNNING_AVG_DF_FILENAME,
+    TEAM_SNAPSHOT_FILENAME,
     TRAINED_MODEL_FILENAME,
     TRAINED_SCALER_FILENAME,
+    TRAINED_PARAMS_FILENAME,
     MATCHUPS_FILENAME,
 )
 
+# pandas, scikit-learn and the modules that use them take seconds to import, so
+# each command imports only what it needs. Predicting only needs numpy.
+if TYPE_CHECKING:
+    import pandas as pd
+
+    from nfl_analytics.inference import LinearModelParams, TeamSnapshot
+    from nfl_analytics.model import RunningAvgLookup, TrainingMatrix
+
 
 # ROUGH CLI docs:
 # --download: optional. takes list of years. or if empty, defaults to downloading all play-by-play data years. usage: python main.py --download 2021 2022
+# --stream: optional. with --download, parses seasons while downloading and only keeps the columns used, without saving the raw files. usage: python main.py --download 2023 --stream
 # --download-upcoming-matchups: optional. downloads the upcoming matchups. can be used by --predict-upcoming. usage: python main.py --download-upcoming-matchups
 # --train: optional. if present, trains the model. usage: python main.py --train
+# --incremental: optional. with --train, only adds the games that are new to each season's saved running averages. usage: python main.py --train --incremental
+# --incremental-fit: optional. with --train, fits the model on all games from saved sums, only adding the weeks that are new or changed. usage: python main.py --train --incremental-fit
+# --workers: optional. number of processes used to load data for --train, --backtest and --sweep. usage: python main.py --train --workers 4
+# --memory-budget: optional. with --train, limits how many seasons are loaded at once to stay within this many MB. usage: python main.py --train --memory-budget 2048
+# --backtest: optional. trains on all previous weeks and predicts each week from the start year (defaults to the second season) on. usage: python main.py --backtest 2010
+# --sweep: optional. scores estimators (all with no argument values) on subsets of FEATURES and saves them ranked. usage: python main.py --sweep ridge lasso
 # --predict: optional. takes two arguments, home team and away team. usage: python main.py --predict "CHI" "MIN"
 # --predict-upcoming: optional. fetches and predicts all upcoming matchups. usage: python main.py --predict-upcoming
 
 
-def _load_df_running_avg():
+def _build_running_avg(args: argparse.Namespace) -> "pd.DataFrame":
+    from nfl_analytics.dataframes import build_running_avg_dataframe
+    from nfl_analytics.running_average import build_running_avg_dataframe_incremental
+
+    start_time = time.time()
+    try:
+        if args.incremental:
+            print("Building running averages from saved seasons...")
+            df_running_avg = build_running_avg_dataframe_incremental()
+        else:
+            print("Building running averages one season at a time...")
+            df_running_avg = build_running_avg_dataframe(
+                workers=args.workers, memory_budget_mb=args.memory_budget
+            )
+    except FileNotFoundError as e:
+        print(f"Error loading data: {e}")
+        print("Please run with --download first.")
+        exit(1)
+    end_time = time.time()
+    print(f"Built running averages in {end_time - start_time} seconds")
+
+    return df_running_avg
+
+
+def _load_training_matrix(
+    args: argparse.Namespace, df_running_avg: Optional["pd.DataFrame"] = None
+) -> "TrainingMatrix":
+    """
+    The training matrix saved by the last run if the data hasn't changed since.
+    Otherwise builds it from df_running_avg, or builds the running averages too
+    if they aren't given.
+    """
+    from nfl_analytics.model import load_training_matrix
+
+    def get_running_avg() -> "pd.DataFrame":
+        if df_running_avg is not None:
+            return df_running_avg
+
+        return _build_running_avg(args)
+
+    try:
+        return load_training_matrix(get_running_avg)
+    except FileNotFoundError as e:
+        print(f"Error loading data: {e}")
+        print("Please run with --download first.")
+        exit(1)
+
+
+def _load_latest_running_avg() -> Union["TeamSnapshot", "RunningAvgLookup"]:
+    """
+    Each team's latest running averages, which is all predicting upcoming games
+    needs. Falls back to all the running averages for assets from before the
+    snapshot was saved.
+    """
+    from nfl_analytics.inference import TeamSnapshot
+
+    try:
+        snapshot = TeamSnapshot.load(
+            get_latest_timestamped_filepath(TEAM_SNAPSHOT_FILENAME, ".npz")
+        )
+    except FileNotFoundError:
+        return _load_running_avg()
+
+    print(f"Using running averages as of {snapshot.year} week {snapshot.week}")
+    return snapshot
+
+
+def _load_running_avg() -> "RunningAvgLookup":
+    # Memory maps the binary running averages. Assets from before they were
+    # saved only have the csv, which has to be parsed in full.
+    from nfl_analytics.model import RunningAvgLookup
+
+    try:
+        return RunningAvgLookup.load(
+            get_latest_timestamped_filepath(RUNNING_AVG_DF_FILENAME, ".npy")
+        )
+    except FileNotFoundError:
+        pass
+
     try:
         latest_running_avg_filename = get_latest_timestamped_filepath(
             RUNNING_AVG_DF_FILENAME, ".csv.gz"
@@ -56,10 +127,33 @@ def _load_df_running_avg():
     except FileNotFoundError:
         print("No running average dataframe found. Please run with --train first.")
         exit(1)
-    return pd.read_csv(latest_running_avg_filename, low_memory=False)
+
+    import pandas as pd
+
+    return RunningAvgLookup(pd.read_csv(latest_running_avg_filename, low_memory=False))
+
+
+def _load_model_params() -> "LinearModelParams":
+    """
+    The trained model as plain arrays. Falls back to converting the joblib model
+    and scaler for assets from before the parameters were saved.
+    """
+    from nfl_analytics.inference import LinearModelParams
+
+    try:
+        latest_params_filepath = get_latest_timestamped_filepath(
+            TRAINED_PARAMS_FILENAME, ".npz"
+        )
+    except FileNotFoundError:
+        return LinearModelParams.from_estimators(*_load_model_and_scaler())
+
+    print(f"Loading model parameters from {latest_params_filepath}")
+    return LinearModelParams.load(latest_params_filepath)
 
 
 def _load_model_and_scaler():
+    from joblib import load
+
     try:
         latest_model_filepath = get_latest_timestamped_filepath(
             TRAINED_MODEL_FILENAME, ".joblib"
@@ -86,6 +180,11 @@ def main():
         metavar="year",
         help="Download data for the specified years. The year corresponds to the season start.",
     )
+    parser.add_argument(
+        "--stream",
+        action="store_true",
+        help="With --download, parse the data while it downloads and save only the columns used for training instead of the raw files.",
+    )
     parser.add_argument(
         "--download-upcoming-matchups",
         action="store_true",
@@ -96,6 +195,41 @@ def main():
         action="store_true",
         help="Train the model using the downloaded data.",
     )
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help="With --train, reuse the running averages saved by the last --incremental run, only adding the games that are new since then.",
+    )
+    parser.add_argument(
+        "--incremental-fit",
+        action="store_true",
+        help="With --train, fit the model on all games from sums saved by previous --incremental-fit runs, only adding the weeks that are new or changed since. Fits on every game instead of holding out 20%% to report the error.",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        metavar="count",
+        help="Number of processes used to load the data for --train, and to run --backtest and --sweep. Defaults to the number of CPUs.",
+    )
+    parser.add_argument(
+        "--memory-budget",
+        type=int,
+        metavar="MB",
+        help="With --train, load fewer seasons at once if needed to stay within this much memory.",
+    )
+    parser.add_argument(
+        "--backtest",
+        nargs="*",
+        type=int,
+        metavar="start_year",
+        help="For every week from the start year on, train on all previous weeks and predict that week. Saves each week's errors. Starts from the second season with no argument value.",
+    )
+    parser.add_argument(
+        "--sweep",
+        nargs="*",
+        metavar="estimator",
+        help="Score the given estimators (all of them with no argument values) with all of FEATURES and without each stat, and save the results ranked by mean absolute error.",
+    )
     parser.add_argument(
         "--predict",
         nargs=2,
@@ -111,6 +245,10 @@ def main():
     args = parser.parse_args()
 
     if args.download is not None:
+        from nfl_analytics.data import download_data, stream_data
+
+        fetch_data = stream_data if args.stream else download_data
+
         if args.download:
             year_set = set(args.download)
             invalid_years = [year for year in year_set if not is_valid_year(year)]
@@ -118,51 +256,112 @@ def main():
             if invalid_years:
                 print(f"Invalid year(s) provided: {invalid_years}. No data downloaded.")
             else:
-                download_data(year_set)
+                fetch_data(year_set)
         else:
-            download_data()
+            fetch_data()
 
     if args.download_upcoming_matchups:
+        from nfl_analytics.schedule import get_upcoming_matchups, save_upcoming_matchups
+
         print("Downloading upcoming matchups...")
         matchups = get_upcoming_matchups()
         save_upcoming_matchups(matchups)
 
     if args.train:
+        import pandas as pd
+
+        # Columns shared between the pipeline's dataframes aren't copied until
+        # they're modified. See the ownership notes in dataframes.py.
+        pd.set_option("mode.copy_on_write", True)
+
+        from nfl_analytics.data import save_dataframe
+        from nfl_analytics.model import (
+            train_model,
+            save_model_and_scaler,
+            save_running_avg_lookup,
+            save_team_snapshot,
+        )
+
+        df_running_avg = _build_running_avg(args)
+
+        print("Training model...")
+
+        timestamp = int(time.time())
+
+        save_dataframe(df_running_avg, f"{RUNNING_AVG_DF_FILENAME}-{timestamp}")
+        save_running_avg_lookup(df_running_avg, timestamp)
+        save_team_snapshot(df_running_avg, timestamp)
+
+        matrix = _load_training_matrix(args, df_running_avg)
+
+        if args.incremental_fit:
+            from nfl_analytics.regression_stats import update_regression_stats
+
+            model, scaler = update_regression_stats(matrix)
+        else:
+            model, scaler = train_model(matrix)
+
+        save_model_and_scaler(model, scaler, timestamp)
+
+    if args.backtest is not None:
+        import pandas as pd
+
+        pd.set_option("mode.copy_on_write", True)
+
+        from nfl_analytics.backtest import backtest, save_backtest, summarize_backtest
+
+        start_year = args.backtest[0] if args.backtest else None
+        if start_year is not None and not is_valid_year(start_year):
+            print(f"Invalid year provided: {start_year}.")
+            exit(1)
+
+        matrix = _load_training_matrix(args)
+
+        print("Backtesting...")
         start_time = time.time()
         try:
-            print("Loading dataframe...")
-            df_raw = load_dataframe_from_raw()
-        except FileNotFoundError as e:
-            print(f"Error loading data: {e}")
-            print("Please run with --download first.")
+            df_backtest = backtest(matrix, start_year, args.workers)
+        except ValueError as e:
+            print(e)
             exit(1)
         end_time = time.time()
-        print(f"Loaded dataframe in {end_time - start_time} seconds")
+        print(f"Backtested {len(df_backtest)} weeks in {end_time - start_time} seconds")
 
-        print("Training model...")
+        print(summarize_backtest(df_backtest))
+        save_backtest(df_backtest, int(time.time()))
 
-        # -- Maybe require filepath to use saved version? --
-        # This wont pick on updated data (downlaoded new data but still have combined, so it will use that)
-        # Save combined dataframe to disk
-        # save_dir = os.path.join("data", "combined")
-        # os.makedirs(save_dir, exist_ok=True)
-        # save_path = os.path.join(save_dir, "play_by_play_combined.parquet.gzip")
-        # df_raw.to_parquet(save_path, compression="gzip")
+    if args.sweep is not None:
+        import pandas as pd
 
-        timestamp = int(time.time())
+        pd.set_option("mode.copy_on_write", True)
 
-        df_running_avg = build_running_avg_dataframe(df_raw)
-        save_dataframe(df_running_avg, f"{RUNNING_AVG_DF_FILENAME}-{timestamp}")
+        from nfl_analytics.sweep import ESTIMATORS, save_sweep, sweep
 
-        df_training = build_training_dataframe(df_running_avg)
-        model, scaler = train_model(df_training)
+        invalid_estimators = [name for name in args.sweep if name not in ESTIMATORS]
+        if invalid_estimators:
+            print(
+                f"Invalid estimator(s) provided: {invalid_estimators}. "
+                f"Choose from {list(ESTIMATORS)}."
+            )
+            exit(1)
 
-        save_model_and_scaler(model, scaler, timestamp)
+        matrix = _load_training_matrix(args)
+
+        print("Sweeping...")
+        start_time = time.time()
+        df_sweep = sweep(matrix, args.sweep or None, workers=args.workers)
+        end_time = time.time()
+        print(
+            f"Evaluated {len(df_sweep)} configurations in {end_time - start_time} seconds"
+        )
+
+        print(df_sweep.head(10).to_string())
+        save_sweep(df_sweep, int(time.time()))
 
     if args.predict:
-        # TODO: this will silently predict based off old data if thats all we have.
-        # Perhaps I should require the week/year in the predict fn? Or at least log
-        # year/week in predict? Or maybe aligning everything by timestamp will resolve this?
+        from nfl_analytics.inference import predict_spreads
+        from nfl_analytics.schedule import Matchup
+
         home_team = normalize_team_abbr(args.predict[0].upper())
         away_team = normalize_team_abbr(args.predict[1].upper())
 
@@ -175,15 +374,25 @@ def main():
             print("Home and away team cannot be the same.")
             exit(1)
 
-        model, scaler = _load_model_and_scaler()
-        df_running_avg = _load_df_running_avg()
-        predicted_spread = predict(model, scaler, df_running_avg, home_team, away_team)
+        params = _load_model_params()
+        running_avg = _load_latest_running_avg()
+        [prediction] = predict_spreads(
+            params, running_avg, [Matchup(home_team, away_team)]
+        )
+        predicted_spread = prediction.spread
 
         print(
             f"Predicted spread for {home_team} (home) vs {away_team} (away): {predicted_spread}"
         )
 
     if args.predict_upcoming is not None:
+        from nfl_analytics.inference import predict_spreads, save_predictions
+        from nfl_analytics.schedule import (
+            get_upcoming_matchups,
+            load_matchups,
+            Matchup,
+        )
+
         matchups = None
 
         if args.predict_upcoming:
@@ -214,10 +423,11 @@ def main():
             print("No matchups found.")
             exit(0)
 
-        df_running_avg = _load_df_running_avg()
-        model, scaler = _load_model_and_scaler()
+        # Load the running averages once rather than for every matchup
+        running_avg = _load_latest_running_avg()
+        params = _load_model_params()
 
-        predictions: List[Prediction] = []
+        normalized_matchups: List[Matchup] = []
 
         for matchup in matchups:
             home_team, away_team = normalize_team_abbr(
@@ -229,13 +439,12 @@ def main():
                     print(f"Invalid team: {team}")
                     exit(1)
 
-            predicted_spread = predict(
-                model, scaler, df_running_avg, home_team, away_team
-            )
-            predictions.append(Prediction(home_team, away_team, predicted_spread))
+            normalized_matchups.append(Matchup(home_team, away_team))
+
+        predictions = predict_spreads(params, running_avg, normalized_matchups)
 
-            print(predictions)
-            save_predictions(predictions)
+        print(predictions)
+        save_predictions(predictions)
 
 
 if __name__ == "__main__":
@@ -1,6 +1,6 @@
-import os, time, json
-from typing import Tuple, Optional, Union, List
-from dataclasses import dataclass, asdict
+import os
+from dataclasses import dataclass
+from typing import Callable, Dict, Tuple, Optional, Union, List
 
 import pandas as pd
 from sklearn.model_selection import train_test_split
@@ -10,38 +10,280 @@ from sklearn.impute import SimpleImputer
 from sklearn.preprocessing import StandardScaler
 from joblib import dump
 from scipy.sparse import spmatrix
+import numpy as np
 from numpy import ndarray
 
-from nfl_analytics.config import FEATURES, ASSET_DIR as ASSET_DIR_
+from nfl_analytics.schedule import Matchup
+from nfl_analytics.data import (
+    CACHE_DIR,
+    get_season_filenames,
+    get_season_cache_key,
+    read_cached_file,
+    write_cached_file,
+)
+from nfl_analytics.dataframes import RUNNING_AVG_CACHE_VERSION, build_training_dataframe
+from nfl_analytics.inference import (
+    LinearModelParams,
+    Prediction,
+    TeamSnapshot,
+    get_matchup_matrix,
+)
+from nfl_analytics.config import (
+    FEATURES,
+    RUNNING_AVG_COLUMNS,
+    RUNNING_AVG_DF_FILENAME,
+    TEAM_SNAPSHOT_FILENAME,
+    TRAINED_PARAMS_FILENAME,
+    ASSET_DIR as ASSET_DIR_,
+)
 
 SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
 ASSET_DIR = os.path.join(SCRIPT_DIR, ASSET_DIR_)
+# The spread relative to the home team, see select_game_results
+TARGET = "home_spread"
+TRAINING_MATRIX_PATH = os.path.join(CACHE_DIR, "training_matrix.npz")
+# Bump when changes to building the training matrix change it
+TRAINING_MATRIX_CACHE_VERSION = 1
+
+
+class RunningAvgLookup:
+    """
+    The running averages of each (year, week, team) as records sorted by year,
+    week and team, which can be saved as a .npy file and loaded memory mapped.
+    Where each week's rows start and end is indexed when it's built, so getting a
+    team's row only searches that week's rows rather than every season's.
+    """
+
+    KEY_COLUMNS = ["year", "week", "team"]
+
+    def __init__(self, running_avg: Union[pd.DataFrame, ndarray]):
+        if isinstance(running_avg, pd.DataFrame):
+            running_avg = self.to_records(running_avg)
+
+        # df_running_avg include running averages prior to that week, and data about
+        # that week itself: teams, final scores, etc.). Basically (and literally at
+        # the time of writing) anything not suffixed with `_avg`. The data about the
+        # week itself are necessary for training the model but dont make sense in
+        # the context of predicting future games so they are not included here.
+        self.columns = list(RUNNING_AVG_COLUMNS.values())
+        self._records = running_avg
+        self._week_bounds = self._get_week_bounds(running_avg)
+        self.latest_year = int(self._records[-1]["year"])
+
+    @classmethod
+    def to_records(cls, df_running_avg: pd.DataFrame) -> ndarray:
+        teams = df_running_avg["team"].astype(str)
+        dtype = [
+            ("year", "<i2"),
+            ("week", "<i2"),
+            ("team", f"<U{teams.str.len().max()}"),
+        ] + [(column, "<f8") for column in RUNNING_AVG_COLUMNS.values()]
+
+        records = np.empty(len(df_running_avg), dtype=dtype)
+        records["year"] = df_running_avg["year"]
+        records["week"] = df_running_avg["week"]
+        records["team"] = teams
+        for column in RUNNING_AVG_COLUMNS.values():
+            records[column] = df_running_avg[column]
+
+        records.sort(order=cls.KEY_COLUMNS)
+        return records
+
+    @classmethod
+    def load(cls, path: str) -> "RunningAvgLookup":
+        return cls(np.load(path, mmap_mode="r"))
+
+    def save(self, path: str) -> None:
+        np.save(path, self._records)
+
+    def last_week(self, year: int) -> int:
+        weeks = [week for week_year, week in self._week_bounds if week_year == year]
+
+        if not weeks:
+            raise KeyError(year)
+
+        return max(weeks)
+
+    def get(self, year: int, week: int, team: str) -> ndarray:
+        """
+        The team's running averages for the week. A team without a row that week
+        (e.g. on bye) has its averages from its last game week before that, like
+        TeamSnapshot. All NaN if the team has no row that year up to the week.
+        """
+        for previous_week in range(week, 0, -1):
+            row = self._find_row(year, previous_week, team)
+
+            if row is not None:
+                record = self._records[row]
+                return np.array(
+                    [record[column] for column in self.columns], dtype="float64"
+                )
+
+        return np.full(len(self.columns), np.nan)
+
+    def _find_row(self, year: int, week: int, team: str) -> Optional[int]:
+        start, end = self._week_bounds.get((year, week), (0, 0))
+        row = start + int(np.searchsorted(self._records["team"][start:end], team))
+
+        if row == end or self._records[row]["team"] != team:
+            return None
+
+        return row
+
+    @staticmethod
+    def _get_week_bounds(records: ndarray) -> Dict[Tuple[int, int], Tuple[int, int]]:
+        """(year, week) -> the start and end of that week's rows."""
+        year = records["year"].astype("int64")
+        week = records["week"].astype("int64")
+        boundaries = np.flatnonzero(np.diff(year * 100 + week)) + 1
+        starts = np.concatenate([[0], boundaries]).tolist()
+        ends = np.concatenate([boundaries, [len(records)]]).tolist()
+
+        return {
+            (int(year[start]), int(week[start])): (start, end)
+            for start, end in zip(starts, ends)
+        }
+
+
+def save_running_avg_lookup(df_running_avg: pd.DataFrame, timestamp: int) -> None:
+    os.makedirs(ASSET_DIR, exist_ok=True)
+
+    filename = f"{RUNNING_AVG_DF_FILENAME}-{timestamp}.npy"
+    RunningAvgLookup(df_running_avg).save(os.path.join(ASSET_DIR, filename))
+    print(f"Running average lookup saved to {filename}")
+
+
+def save_team_snapshot(df_running_avg: pd.DataFrame, timestamp: int) -> None:
+    os.makedirs(ASSET_DIR, exist_ok=True)
+
+    filename = f"{TEAM_SNAPSHOT_FILENAME}-{timestamp}.npz"
+    TeamSnapshot.from_dataframe(df_running_avg).save(os.path.join(ASSET_DIR, filename))
+    print(f"Team snapshot saved to {filename}")
 
 
 @dataclass
-class Prediction:
-    home_team: str
-    away_team: str
-    spread: float
+class TrainingMatrix:
+    """
+    The rows train_model trains on as arrays: FEATURES (NaN where missing, not
+    imputed) and the target, sorted by year and week. Build it once from the
+    training dataframe and slice it for every model fit on a subset of the weeks.
+    Rows without a target (a game without a final score differential) are left
+    out rather than given the mean spread, which isn't a result the model should
+    learn from.
+
+    Features and targets are rounded to float32, the precision they are saved
+    with (see load_training_matrix), so a matrix read from the cache is the same
+    as one built from the dataframe.
+    """
+
+    X: ndarray
+    y: ndarray
+    year: ndarray
+    week: ndarray
+    # Each row's game, numbered from 0
+    game: ndarray
+
+    @classmethod
+    def from_training_dataframe(cls, df_training: pd.DataFrame) -> "TrainingMatrix":
+        # Drop week 1 because is all NaN, like train_model
+        df_train = df_training.loc[
+            (df_training["week"] > 1) & df_training[TARGET].notna()
+        ]
+        year = df_train["year"].to_numpy(dtype="int64")
+        week = df_train["week"].to_numpy(dtype="int64")
+        order = np.lexsort((week, year))
+
+        return cls(
+            X=df_train[FEATURES].to_numpy(dtype="float32")[order].astype("float64"),
+            y=df_train[TARGET].to_numpy(dtype="float32")[order].astype("float64"),
+            year=year[order],
+            week=week[order],
+            game=pd.factorize(df_train["game_id"])[0][order],
+        )
+
+    @classmethod
+    def load(cls, path: str) -> "TrainingMatrix":
+        with np.load(path) as matrix:
+            if list(matrix["features"]) != FEATURES:
+                raise ValueError(f"{path} has different features than expected")
+
+            return cls(
+                X=matrix["X"].astype("float64"),
+                y=matrix["y"].astype("float64"),
+                year=matrix["year"].astype("int64"),
+                week=matrix["week"].astype("int64"),
+                game=matrix["game"].astype("int64"),
+            )
+
+    def save(self, path: str) -> None:
+        np.savez(
+            path,
+            features=np.array(FEATURES),
+            X=self.X.astype("float32"),
+            y=self.y.astype("float32"),
+            year=self.year.astype("int16"),
+            week=self.week.astype("int8"),
+            game=self.game.astype("int32"),
+        )
+
+    def get_week_bounds(self) -> Dict[Tuple[int, int], Tuple[int, int]]:
+        """
+        (year, week) -> the start and end of that week's rows. Every row before
+        the start is from an earlier week.
+        """
+        keys = self.year * 100 + self.week
+        boundaries = np.flatnonzero(np.diff(keys)) + 1
+        starts = np.concatenate([[0], boundaries]).tolist()
+        ends = np.concatenate([boundaries, [len(keys)]]).tolist()
+
+        return {
+            (int(self.year[start]), int(self.week[start])): (start, end)
+            for start, end in zip(starts, ends)
+        }
+
+
+def load_training_matrix(
+    get_running_avg: Callable[[], pd.DataFrame], path: str = TRAINING_MATRIX_PATH
+) -> TrainingMatrix:
+    """
+    Reads the training matrix saved by a previous call if nothing it was built
+    from has changed: the downloaded seasons, FEATURES and how the running
+    averages are built. Otherwise builds it from get_running_avg(), which must
+    return the running averages of the downloaded seasons, and saves it.
+    Skips building the running averages and training dataframe when the saved
+    matrix is up to date.
+    """
+    cache_key = get_training_matrix_cache_key()
+
+    matrix = read_cached_file(path, cache_key, TrainingMatrix.load, "training matrix")
+    if matrix is not None:
+        return matrix
+
+    matrix = TrainingMatrix.from_training_dataframe(
+        build_training_dataframe(get_running_avg())
+    )
+    write_cached_file(path, cache_key, matrix.save)
 
+    return matrix
 
-def train_model(df_training: pd.DataFrame) -> Tuple[LinearRegression, StandardScaler]:
-    # Drop week 1 because is all NaN
-    df_train = df_training[df_training["week"] > 1]
 
-    # Dont use unnecessary columns like 'game_id', 'week', 'year', 'team', 'home_team', 'away_team'
-    # Keep only relevant columns for prediction
-    target = "home_spread"
-    select_columns = FEATURES + [target]
+def get_training_matrix_cache_key() -> dict:
+    return {
+        "seasons": {
+            filename: get_season_cache_key(filename)
+            for filename in get_season_filenames()
+        },
+        "features": FEATURES,
+        "running_avg_version": RUNNING_AVG_CACHE_VERSION,
+        "version": TRAINING_MATRIX_CACHE_VERSION,
+    }
 
-    df_train = df_train[select_columns]
 
+def train_model(matrix: TrainingMatrix) -> Tuple[LinearRegression, StandardScaler]:
     # TODO: why are there missing values?
     imputer = SimpleImputer(strategy="mean")
-    df_imputed = pd.DataFrame(imputer.fit_transform(df_train), columns=df_train.columns)
-
-    X = df_imputed.drop(target, axis=1)
-    y = df_imputed[target]
+    X = imputer.fit_transform(matrix.X)
+    y = matrix.y
 
     X_train, X_test, y_train, y_test = train_test_split(
         X, y, test_size=0.2, random_state=42
@@ -73,92 +315,106 @@ def save_model_and_scaler(
     model_filename = f"trained_model-{timestamp}.joblib"
     scaler_filename = f"trained_scaler-{timestamp}.joblib"
 
+    # The same model and scaler as plain arrays, so predicting doesn't need sklearn
+    params_filename = f"{TRAINED_PARAMS_FILENAME}-{timestamp}.npz"
+
     dump(model, os.path.join(ASSET_DIR, model_filename))
     dump(scaler, os.path.join(ASSET_DIR, scaler_filename))
+    LinearModelParams.from_estimators(model, scaler).save(
+        os.path.join(ASSET_DIR, params_filename)
+    )
     print(f"Model saved to {model_filename}")
     print(f"Scaler saved to {scaler_filename}")
+    print(f"Model parameters saved to {params_filename}")
 
 
 def predict(
     model: LinearRegression,
     scaler: StandardScaler,
-    df_running_avg: pd.DataFrame,
+    running_avg: Union[pd.DataFrame, RunningAvgLookup, TeamSnapshot],
     home_team: str,
     away_team: str,
 ) -> float:
-    matchup = make_matchup(df_running_avg, home_team, away_team)
+    matchup = make_matchup(running_avg, home_team, away_team)
     matchup_input = get_matchup_input(scaler, matchup)
 
     return model.predict(matchup_input)[0]
 
 
-def save_predictions(predictions: List[Prediction]) -> None:
-    os.makedirs(ASSET_DIR, exist_ok=True)
-
-    filepath = os.path.join(ASSET_DIR, f"predictions-{int(time.time())}.json")
-    with open(filepath, "w") as json_file:
-        predictions_dict = [asdict(p) for p in predictions]
-        json.dump(predictions_dict, json_file)
+def predict_many(
+    model: LinearRegression,
+    scaler: StandardScaler,
+    running_avg: Union[pd.DataFrame, RunningAvgLookup, TeamSnapshot],
+    matchups: List[Matchup],
+    week: Optional[int] = None,
+    year: Optional[int] = None,
+) -> List[Prediction]:
+    """
+    Predicts a whole slate of matchups at once. All the matchup inputs go into a
+    single matrix so there is one call to scale them and one call to predict.
+    """
+    if not matchups:
+        return []
+
+    matchup_inputs = scaler.transform(
+        make_matchup_matrix(running_avg, matchups, week, year)
+    )
+    spreads = model.predict(matchup_inputs)
 
-    print(f"Predictions saved to {filepath}")
+    return [
+        Prediction(matchup.home_team, matchup.away_team, spread)
+        for matchup, spread in zip(matchups, spreads.tolist())
+    ]
 
 
 def make_matchup(
-    df_running_avg: pd.DataFrame,
+    running_avg: Union[pd.DataFrame, RunningAvgLookup, TeamSnapshot],
     home_team: str,
     away_team: str,
     week: Optional[int] = None,
     year: Optional[int] = None,
 ) -> pd.DataFrame:
     """Merge given team/week/years stats into a single row.
-    To be used for predicting spreads for future games."""
-
-    df = df_running_avg.copy()
+    To be used for predicting spreads for future games.
+    A DataFrame is turned into a RunningAvgLookup on every call, so pass a
+    RunningAvgLookup instead to make many matchups from the same running averages.
+    """
+    running_avg = _as_lookup(running_avg)
 
     if year is None:
-        year = df["year"].max()
+        year = running_avg.latest_year
 
     if week is None:
-        last_week = df[df["year"] == year]["week"].max()
-        week = last_week
-
-    # df_running_avg include running averages prior to that week, and data about
-    # that week itself: teams, final scores, etc.). Basically (and literally at
-    # the time of writing) anything not suffixed with `_avg`. The data about the
-    # week itself are necessary for training the model but dont make sense in
-    # the context of predicting future games so they are not included here.
-    cols = [
-        "rushing_avg",
-        "passing_avg",
-        "yards_gained_avg",
-        "sack_yards_avg",
-        "passing_yards_defense_avg",
-        "rushing_yards_defense_avg",
-        "yards_gained_defense_avg",
-        "sack_yards_defense_avg",
-        "score_differential_post_avg",
-        "points_scored_avg",
-        "points_allowed_avg",
-        "mean_epa_avg",
-    ]
+        week = running_avg.last_week(year)
 
     # Select data for the specified week, home team, and away team in the specified year
-    home_data = (
-        df[(df["year"] == year) & (df["week"] == week) & (df["team"] == home_team)][
-            cols
-        ]
-        .add_prefix("home_")
-        .reset_index(drop=True)
-    )
-    away_data = (
-        df[(df["year"] == year) & (df["week"] == week) & (df["team"] == away_team)][
-            cols
-        ]
-        .add_prefix("away_")
-        .reset_index(drop=True)
+    home_data = running_avg.get(year, week, home_team)
+    away_data = running_avg.get(year, week, away_team)
+
+    return pd.DataFrame(
+        [np.concatenate([home_data, away_data])],
+        columns=[f"home_{col}" for col in running_avg.columns]
+        + [f"away_{col}" for col in running_avg.columns],
     )
 
-    return pd.concat([home_data, away_data], axis=1)
+
+def make_matchup_matrix(
+    running_avg: Union[pd.DataFrame, RunningAvgLookup, TeamSnapshot],
+    matchups: List[Matchup],
+    week: Optional[int] = None,
+    year: Optional[int] = None,
+) -> ndarray:
+    """Like make_matchup for many matchups. Returns one row of FEATURES per matchup."""
+    return get_matchup_matrix(_as_lookup(running_avg), matchups, week, year)
+
+
+def _as_lookup(
+    running_avg: Union[pd.DataFrame, RunningAvgLookup, TeamSnapshot],
+) -> Union[RunningAvgLookup, TeamSnapshot]:
+    if isinstance(running_avg, pd.DataFrame):
+        return RunningAvgLookup(running_avg)
+
+    return running_avg
 
 
 def get_matchup_input(
@@ -169,18 +425,18 @@ def get_matchup_input(
 
 
 if __name__ == "__main__":
-    from nfl_analytics.dataframes import (
-        build_running_avg_dataframe,
-        build_training_dataframe,
-    )
+    from nfl_analytics.dataframes import build_running_avg_dataframe
 
     df_running_avg = build_running_avg_dataframe()
-    df_training = build_training_dataframe()
-    model, scaler = train_model(df_training)
-    print(make_matchup(df_running_avg, "KC", "SF").tail())
+    matrix = TrainingMatrix.from_training_dataframe(
+        build_training_dataframe(df_running_avg)
+    )
+    model, scaler = train_model(matrix)
+    running_avg = RunningAvgLookup(df_running_avg)
+    print(make_matchup(running_avg, "KC", "SF").tail())
     # first team is home but this is superbowl so neither is technically home
     # week 22 (? its the superbowl) 2023 (2023 SEASON, year is 2024)
-    kc_sf = predict(model, scaler, df_running_avg, "KC", "SF")
+    kc_sf = predict(model, scaler, running_avg, "KC", "SF")
     print(f"Prediction: {kc_sf}")
-    sf_kc = predict(model, scaler, df_running_avg, "SF", "KC")
+    sf_kc = predict(model, scaler, running_avg, "SF", "KC")
     print(f"Prediction: {sf_kc}")
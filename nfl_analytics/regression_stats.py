@@ -0,0 +1,302 @@
+"""
+Fits the spread model from sufficient statistics instead of from every row.
+The imputer, scaler and linear regression fitted on all of the training rows
+only depend on a few sums over those rows, so the sums are saved and each new
+week of games is added to them. Solving for the model from the sums takes
+microseconds, no matter how many seasons there are.
+"""
+
+import hashlib
+import os
+from dataclasses import dataclass, field, fields
+from typing import Dict, List, Tuple
+
+import numpy as np
+from numpy import ndarray
+from sklearn.linear_model import LinearRegression
+from sklearn.preprocessing import StandardScaler
+
+from nfl_analytics.config import FEATURES
+from nfl_analytics.data import CACHE_DIR
+from nfl_analytics.model import TrainingMatrix
+
+STATS_PATH = os.path.join(CACHE_DIR, "regression_stats.npz")
+
+
+@dataclass
+class RegressionStats:
+    """
+    Sums over the training rows that the model is solved from. X0 is the
+    features with missing values as 0 and M is 1 where a value is missing.
+    Missing values are imputed with the mean of the column (like SimpleImputer),
+    which changes as rows are added, so the sums involving M are kept to apply
+    the imputation when solving rather than when adding.
+    """
+
+    row_count: int
+    # Sum and number of the non-missing values of each feature
+    x_sums: ndarray
+    x_counts: ndarray
+    # X0ᵀX0, MᵀX0 and MᵀM
+    xtx: ndarray
+    mtx: ndarray
+    mtm: ndarray
+    # X0ᵀy, Mᵀy and the sum of y
+    xty: ndarray
+    mty: ndarray
+    y_sum: float
+
+    @classmethod
+    def empty(cls) -> "RegressionStats":
+        feature_count = len(FEATURES)
+        return cls(
+            row_count=0,
+            x_sums=np.zeros(feature_count),
+            x_counts=np.zeros(feature_count),
+            xtx=np.zeros((feature_count, feature_count)),
+            mtx=np.zeros((feature_count, feature_count)),
+            mtm=np.zeros((feature_count, feature_count)),
+            xty=np.zeros(feature_count),
+            mty=np.zeros(feature_count),
+            y_sum=0.0,
+        )
+
+    def add(self, X: ndarray, y: ndarray) -> None:
+        """Adds rows of FEATURES (NaN where missing) and their targets."""
+        missing = np.isnan(X)
+        X0 = np.where(missing, 0.0, X)
+        M = missing.astype("float64")
+
+        self.row_count += len(X)
+        self.x_sums += X0.sum(axis=0)
+        self.x_counts += len(X) - missing.sum(axis=0)
+        self.xtx += X0.T @ X0
+        self.mtx += M.T @ X0
+        self.mtm += M.T @ M
+        self.xty += X0.T @ y
+        self.mty += M.T @ y
+        self.y_sum += float(y.sum())
+
+    @classmethod
+    def combine(cls, stats: List["RegressionStats"]) -> "RegressionStats":
+        """The stats of all of the rows added to any of stats."""
+        total = cls.empty()
+        for other in stats:
+            for stat in fields(cls):
+                setattr(
+                    total,
+                    stat.name,
+                    getattr(total, stat.name) + getattr(other, stat.name),
+                )
+
+        return total
+
+    def solve(self) -> Tuple[LinearRegression, StandardScaler]:
+        """
+        The scaler and model that fitting SimpleImputer(strategy="mean"),
+        StandardScaler and LinearRegression on all of the added rows makes, to
+        numerical precision. Predict with them like the ones train_model returns.
+        """
+        if self.row_count == 0:
+            raise ValueError("No rows have been added.")
+
+        empty_features = [
+            feature for feature, count in zip(FEATURES, self.x_counts) if count == 0
+        ]
+        if empty_features:
+            raise ValueError(f"No values to impute {empty_features} with.")
+
+        n = self.row_count
+        # Imputed values are the mean, so the imputed columns have the same mean
+        mean = self.x_sums / self.x_counts
+        y_mean = self.y_sum / n
+
+        # Xᵀ X and Xᵀ y of the imputed features X = X0 + M diag(mean)
+        xtx = (
+            self.xtx
+            + self.mtx.T * mean[np.newaxis, :]
+            + mean[:, np.newaxis] * self.mtx
+            + np.outer(mean, mean) * self.mtm
+        )
+        xty = self.xty + mean * self.mty
+
+        covariance = xtx / n - np.outer(mean, mean)
+        covariance_y = xty / n - mean * y_mean
+
+        var = np.diag(covariance).copy()
+        # Like StandardScaler, constant features aren't scaled
+        scale = np.where(var > 0, np.sqrt(np.maximum(var, 0)), 1.0)
+
+        # Least squares on the scaled features. The minimum norm solution, like
+        # LinearRegression, in case features are collinear.
+        correlation = covariance / np.outer(scale, scale)
+        coef = np.linalg.lstsq(correlation, covariance_y / scale, rcond=None)[0]
+
+        scaler = StandardScaler()
+        scaler.mean_ = mean
+        scaler.var_ = var
+        scaler.scale_ = scale
+        scaler.n_samples_seen_ = n
+        scaler.n_features_in_ = len(FEATURES)
+
+        model = LinearRegression()
+        model.coef_ = coef
+        # The scaled features' mean is 0
+        model.intercept_ = y_mean
+        model.n_features_in_ = len(FEATURES)
+
+        return model, scaler
+
+
+@dataclass
+class SeasonRegressionStats:
+    """
+    RegressionStats for each season, and a fingerprint of the rows of each week
+    that was added to them. A week's rows change when its games do, e.g. when a
+    week that was only partly played is added again, or a season is downloaded
+    again, or a change to the pipeline changes the running averages. Sums can't
+    have the old rows taken back out, so a season with a week that changed is
+    summed again from the matrix. Seasons are small, so that's still only a few
+    hundred rows.
+    """
+
+    seasons: Dict[int, RegressionStats] = field(default_factory=dict)
+    # (year, week) -> fingerprint of the week's rows
+    weeks: Dict[Tuple[int, int], str] = field(default_factory=dict)
+
+    def update(self, matrix: TrainingMatrix) -> int:
+        """
+        Adds the weeks of matrix that haven't been added yet, and sums the
+        seasons with a week that changed (or isn't in matrix anymore) again.
+        Returns how many rows were added.
+        """
+        week_bounds = matrix.get_week_bounds()
+        fingerprints = {
+            week: _get_fingerprint(matrix, start, end)
+            for week, (start, end) in week_bounds.items()
+        }
+
+        changed_years = {
+            year
+            for (year, week), fingerprint in self.weeks.items()
+            if fingerprints.get((year, week)) != fingerprint
+        }
+        for year in changed_years:
+            self.seasons.pop(year, None)
+        self.weeks = {
+            (year, week): fingerprint
+            for (year, week), fingerprint in self.weeks.items()
+            if year not in changed_years
+        }
+
+        row_count = 0
+        for (year, week), (start, end) in week_bounds.items():
+            if (year, week) in self.weeks:
+                continue
+
+            season = self.seasons.setdefault(year, RegressionStats.empty())
+            season.add(matrix.X[start:end], matrix.y[start:end])
+            self.weeks[(year, week)] = fingerprints[(year, week)]
+            row_count += end - start
+
+        return row_count
+
+    def solve(self) -> Tuple[LinearRegression, StandardScaler]:
+        """Like RegressionStats.solve, on the rows of every season."""
+        return RegressionStats.combine(list(self.seasons.values())).solve()
+
+    @property
+    def row_count(self) -> int:
+        return sum(season.row_count for season in self.seasons.values())
+
+    def save(self, path: str = STATS_PATH) -> None:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        years = sorted(self.seasons)
+        weeks = sorted(self.weeks)
+
+        # One array per stat, with one entry per season
+        np.savez(
+            path,
+            features=np.array(FEATURES),
+            years=np.array(years, dtype="int64"),
+            **{
+                stat.name: np.array(
+                    [getattr(self.seasons[year], stat.name) for year in years]
+                )
+                for stat in fields(RegressionStats)
+            },
+            week_years=np.array([year for year, _ in weeks], dtype="int64"),
+            week_numbers=np.array([week for _, week in weeks], dtype="int64"),
+            week_fingerprints=np.array([self.weeks[week] for week in weeks], dtype="U"),
+        )
+
+    @classmethod
+    def load(cls, path: str = STATS_PATH) -> "SeasonRegressionStats":
+        if not os.path.exists(path):
+            return cls()
+
+        with np.load(path) as stats:
+            # Saved for other features, or before stats were kept per season
+            if "years" not in stats or list(stats["features"]) != FEATURES:
+                return cls()
+
+            seasons = {
+                int(year): RegressionStats(
+                    row_count=int(stats["row_count"][i]),
+                    x_sums=stats["x_sums"][i],
+                    x_counts=stats["x_counts"][i],
+                    xtx=stats["xtx"][i],
+                    mtx=stats["mtx"][i],
+                    mtm=stats["mtm"][i],
+                    xty=stats["xty"][i],
+                    mty=stats["mty"][i],
+                    y_sum=float(stats["y_sum"][i]),
+                )
+                for i, year in enumerate(stats["years"])
+            }
+            weeks = {
+                (int(year), int(week)): str(fingerprint)
+                for year, week, fingerprint in zip(
+                    stats["week_years"],
+                    stats["week_numbers"],
+                    stats["week_fingerprints"],
+                )
+            }
+
+        return cls(seasons, weeks)
+
+
+def _get_fingerprint(matrix: TrainingMatrix, start: int, end: int) -> str:
+    digest = hashlib.sha256(np.ascontiguousarray(matrix.X[start:end]).tobytes())
+    digest.update(np.ascontiguousarray(matrix.y[start:end]).tobytes())
+    return digest.hexdigest()
+
+
+def update_regression_stats(
+    matrix: TrainingMatrix, path: str = STATS_PATH
+) -> Tuple[LinearRegression, StandardScaler]:
+    """
+    Loads the saved stats, adds any new or changed weeks from matrix, saves them
+    again and solves.
+    """
+    stats = SeasonRegressionStats.load(path)
+    row_count = stats.update(matrix)
+    stats.save(path)
+
+    print(f"Added {row_count} rows, fitting on {stats.row_count} rows")
+    return stats.solve()
+
+
+if __name__ == "__main__":
+    from nfl_analytics.dataframes import build_training_dataframe
+
+    matrix = TrainingMatrix.from_training_dataframe(build_training_dataframe())
+
+    # Add the weeks one at a time, as they would be during the season
+    stats = RegressionStats.empty()
+    for start, end in matrix.get_week_bounds().values():
+        stats.add(matrix.X[start:end], matrix.y[start:end])
+
+    model, scaler = stats.solve()
+    print(model.coef_, model.intercept_)
@@ -0,0 +1,281 @@
+"""
+Keeps the running averages up to date one week at a time during the season.
+Only the plays of games that haven't been added yet are processed, instead of
+recomputing every running average from all of the season's plays.
+"""
+
+import json
+import os
+from dataclasses import dataclass, field, asdict
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from nfl_analytics.config import RUNNING_AVG_COLUMNS
+from nfl_analytics.data import (
+    concat_play_by_play,
+    get_season_filenames,
+    get_season_cache_key,
+    get_season_name,
+    load_season_dataframe,
+    read_cached_dataframe,
+    read_stale_cached_dataframe,
+    write_cached_dataframe,
+)
+from nfl_analytics.dataframes import (
+    RUNNING_AVG_CACHE_DIR,
+    RUNNING_AVG_CACHE_VERSION,
+    build_game_dataframe,
+    select_game_results,
+)
+
+
+@dataclass
+class TeamSeasonTotals:
+    """
+    Running totals of a team's game stats for a season. Each list has one entry
+    per stat in RUNNING_AVG_COLUMNS. Missing stats are not counted, like pandas'
+    expanding mean.
+    """
+
+    sums: List[float]
+    counts: List[int]
+    # Sums are compensated (Kahan summation) like pandas' expanding mean so the
+    # averages are exactly the same as the ones build_running_avg_dataframe makes
+    compensations: List[float]
+    # Week of the latest game added
+    last_week: int = 0
+
+    @classmethod
+    def empty(cls) -> "TeamSeasonTotals":
+        stat_count = len(RUNNING_AVG_COLUMNS)
+        return cls([0.0] * stat_count, [0] * stat_count, [0.0] * stat_count)
+
+    def averages(self) -> List[float]:
+        return [
+            total / count if count > 0 else np.nan
+            for total, count in zip(self.sums, self.counts)
+        ]
+
+    def add(self, stats: List[float], week: int) -> None:
+        self.last_week = week
+
+        for i, value in enumerate(stats):
+            if np.isnan(value):
+                continue
+
+            self.counts[i] += 1
+            y = value - self.compensations[i]
+            t = self.sums[i] + y
+            self.compensations[i] = t - self.sums[i] - y
+            self.sums[i] = t
+
+
+@dataclass
+class RunningAverageState:
+    # year -> team -> totals
+    totals: Dict[int, Dict[str, TeamSeasonTotals]] = field(default_factory=dict)
+    # game_id -> number of plays, for every game that has been added
+    games: Dict[str, int] = field(default_factory=dict)
+
+    def update(self, df_plays: pd.DataFrame) -> pd.DataFrame:
+        """
+        Adds the games in df_plays that haven't been added yet, whether they're
+        from a new week or the rest of a week that was only partly added.
+        Returns the running average rows for those games, which are the same as
+        the rows build_running_avg_dataframe makes for them.
+
+        Raises ValueError without changing the state if the number of plays of a
+        game that was already added changed (e.g. it was still being played), or a
+        new game is from before a week one of its teams was already added for.
+        Those can only be handled by starting over. Only the plays of new games are
+        processed, so other corrections to games already added aren't noticed.
+        """
+        play_counts = get_game_play_counts(df_plays)
+
+        changed_games = [
+            game_id
+            for game_id, play_count in play_counts.items()
+            if self.games.get(game_id, play_count) != play_count
+        ]
+        if changed_games:
+            raise ValueError(f"Plays changed for games already added: {changed_games}")
+
+        new_games = [game_id for game_id in play_counts if game_id not in self.games]
+        df_plays = df_plays[df_plays["game_id"].isin(new_games)]
+
+        if df_plays.empty:
+            return pd.DataFrame()
+
+        df_game = build_game_dataframe(df_plays)
+        df_running_avg = select_game_results(df_game)
+
+        rows = list(
+            zip(
+                df_game["team"].astype(str),
+                df_game["year"].astype(int),
+                df_game["week"].astype(int),
+            )
+        )
+
+        # Check before adding anything, so an error leaves the state as it was
+        for team, year, week in rows:
+            totals = self.totals.get(year, {}).get(team)
+            if totals is not None and week <= totals.last_week:
+                raise ValueError(
+                    f"{team}'s {year} week {week} game is new but week "
+                    f"{totals.last_week} was already added"
+                )
+
+        # df_game is in game order, so each team's games are added in the order they were played
+        stats = df_game[list(RUNNING_AVG_COLUMNS)].to_numpy(dtype="float64")
+        averages = np.empty_like(stats)
+
+        for i, (team, year, week) in enumerate(rows):
+            season_totals = self.totals.setdefault(year, {})
+            totals = season_totals.setdefault(team, TeamSeasonTotals.empty())
+
+            averages[i] = totals.averages()
+            totals.add(stats[i].tolist(), week)
+
+        df_running_avg[list(RUNNING_AVG_COLUMNS.values())] = averages
+
+        for game_id in new_games:
+            self.games[game_id] = play_counts[game_id]
+
+        return df_running_avg
+
+    def save(self, path: str) -> None:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        with open(path, "w") as json_file:
+            json.dump({**asdict(self), "version": RUNNING_AVG_CACHE_VERSION}, json_file)
+
+    @classmethod
+    def load(cls, path: str) -> "RunningAverageState":
+        if not os.path.exists(path):
+            return cls()
+
+        with open(path, "r") as json_file:
+            state = json.load(json_file)
+
+        # Saved by an older version of the pipeline, start over
+        if state.get("version") != RUNNING_AVG_CACHE_VERSION:
+            return cls()
+
+        # json object keys are always strings
+        return cls(
+            totals={
+                int(year): {
+                    team: TeamSeasonTotals(**totals)
+                    for team, totals in season_totals.items()
+                }
+                for year, season_totals in state["totals"].items()
+            },
+            games=state["games"],
+        )
+
+
+def get_game_play_counts(df_plays: pd.DataFrame) -> Dict[str, int]:
+    play_counts = df_plays["game_id"].astype(str).value_counts(sort=False)
+
+    return {game_id: int(play_count) for game_id, play_count in play_counts.items()}
+
+
+def build_running_avg_dataframe_incremental() -> pd.DataFrame:
+    """
+    Builds the same dataframe as build_running_avg_dataframe one season at a time.
+    Running averages reset every season, so a season's running averages only
+    depend on that season's plays. Each season's running averages are saved, and
+    are only updated when that season's raw data changes. Then only the games
+    that weren't in it before (normally the latest week's) are added.
+    """
+    filenames = get_season_filenames()
+
+    if not filenames:
+        raise FileNotFoundError("No data files found in the data directory.")
+
+    return concat_play_by_play(
+        [load_season_running_avg(filename) for filename in filenames]
+    )
+
+
+def load_season_running_avg(filename: str) -> pd.DataFrame:
+    name = f"running_average_{get_season_name(filename)}"
+    cache_key = {
+        "season": get_season_cache_key(filename),
+        "version": RUNNING_AVG_CACHE_VERSION,
+    }
+
+    df_running_avg = read_cached_dataframe(RUNNING_AVG_CACHE_DIR, name, cache_key)
+    if df_running_avg is not None:
+        return df_running_avg
+
+    state_path = os.path.join(RUNNING_AVG_CACHE_DIR, f"{name}_state.json")
+    state = RunningAverageState.load(state_path)
+    df_previous = read_stale_cached_dataframe(RUNNING_AVG_CACHE_DIR, name)
+
+    df_running_avg = _update_season_running_avg(
+        load_season_dataframe(filename), state, df_previous
+    )
+    if df_running_avg is None:
+        print(f"Rebuilding {name}")
+        state = RunningAverageState()
+        df_running_avg = _update_season_running_avg(
+            load_season_dataframe(filename), state, None
+        )
+
+    write_cached_dataframe(RUNNING_AVG_CACHE_DIR, name, cache_key, df_running_avg)
+    state.save(state_path)
+
+    return df_running_avg
+
+
+def _update_season_running_avg(
+    df_plays: pd.DataFrame,
+    state: RunningAverageState,
+    df_previous: Optional[pd.DataFrame],
+) -> Optional[pd.DataFrame]:
+    """
+    Adds the season's new games to the state and to the running averages saved
+    before. None if they can't be updated and have to be rebuilt.
+    """
+    previous_games = (
+        set() if df_previous is None else set(df_previous["game_id"].astype(str))
+    )
+    # Saved by a run that was interrupted between saving the two
+    if previous_games != set(state.games):
+        return None
+
+    try:
+        df_new = state.update(df_plays)
+    except ValueError as e:
+        print(e)
+        return None
+
+    if df_previous is None:
+        return df_new
+
+    if df_new.empty:
+        return df_previous
+
+    # Games sort by week, then teams. The new games may be from the same week as
+    # games added before (e.g. Sunday's games after Thursday's).
+    return concat_play_by_play([df_previous, df_new]).sort_values(
+        ["game_id", "team"], kind="stable", ignore_index=True
+    )
+
+
+if __name__ == "__main__":
+    from nfl_analytics.data import load_dataframe_from_raw
+
+    df_raw = load_dataframe_from_raw()
+    latest_year = df_raw["year"].max()
+    df_season = df_raw[df_raw["year"] == latest_year]
+
+    # Add the latest season one week at a time, as it would be during the season
+    state = RunningAverageState()
+    for week in sorted(df_season["week"].unique()):
+        df_week = state.update(df_season[df_season["week"] == week])
+        print(df_week.tail())
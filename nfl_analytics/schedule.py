@@ -2,20 +2,41 @@
 Handles getting the data for upcoming matchups.
 """
 
+import hashlib
 import json
 import os
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+from email.message import Message
 import urllib.request
-from typing import Any, Dict, List
+from urllib.error import HTTPError, URLError
+from typing import Any, Dict, List, Optional, Tuple
 from dataclasses import dataclass, asdict
 from enum import Enum
 from nfl_analytics.utils import ASSET_DIR as ASSET_DIR_, normalize_team_abbr
-from nfl_analytics.config import MATCHUPS_FILENAME
+from nfl_analytics.config import MATCHUPS_FILENAME, DATA_DIR as DATA_DIR_
 
 SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
 ASSET_DIR = os.path.join(SCRIPT_DIR, ASSET_DIR_)
+HTTP_CACHE_DIR = os.path.join(SCRIPT_DIR, DATA_DIR_, "cache", "http")
 BASE_URL = "https://sports.core.api.espn.com/v2/sports/football/leagues/nfl/"
+# Requests for the events and teams of a week are made concurrently, at most this many at a time
+MAX_CONCURRENT_REQUESTS = 8
+REQUEST_TIMEOUT = 10  # seconds
+REQUEST_RETRIES = 3
+# Seconds to wait before the first retry. Doubles for each retry after that.
+REQUEST_BACKOFF = 0.5
+# Seconds a cached response is used before checking with the server whether it
+# changed. None means it's always used. Team documents practically never change.
+CACHE_TTLS = {
+    "team": None,
+    "calendar": 6 * 60 * 60,
+    "season": 6 * 60 * 60,
+    "events": 60 * 60,
+    "event": 60 * 60,
+}
 
 
 @dataclass
@@ -37,6 +58,95 @@ class SeasonPosition:
     week: str
 
 
+class HttpCache:
+    """
+    Saves json responses on disk. A saved response is used without making a request
+    until its ttl expires. After that it's revalidated with the server using its
+    ETag/Last-Modified headers, and used again if the server says it's unchanged.
+    """
+
+    def __init__(self, cache_dir: str = HTTP_CACHE_DIR):
+        self.cache_dir = cache_dir
+        self.hits = 0
+        self.revalidations = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def get_json(self, url: str, ttl: Optional[int]) -> Dict[str, Any]:
+        entry = self._read(url)
+
+        if entry is not None and (
+            ttl is None or time.time() - entry["fetched_at"] < ttl
+        ):
+            self._count("hits")
+            return entry["body"]
+
+        headers = {}
+        if entry is not None and entry["etag"]:
+            headers["If-None-Match"] = entry["etag"]
+        if entry is not None and entry["last_modified"]:
+            headers["If-Modified-Since"] = entry["last_modified"]
+
+        try:
+            body, response_headers = _fetch_json(url, headers)
+        except HTTPError as e:
+            if e.code != 304 or entry is None:
+                raise
+
+            self._count("revalidations")
+            entry["fetched_at"] = time.time()
+            self._write(url, entry)
+            return entry["body"]
+
+        self._count("misses")
+        self._write(
+            url,
+            {
+                "url": url,
+                "fetched_at": time.time(),
+                "etag": response_headers.get("ETag"),
+                "last_modified": response_headers.get("Last-Modified"),
+                "body": body,
+            },
+        )
+        return body
+
+    def stats(self) -> str:
+        return (
+            f"{self.hits} hits, {self.revalidations} revalidated, {self.misses} misses"
+        )
+
+    def _count(self, counter: str) -> None:
+        # Requests are made from multiple threads
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def _get_path(self, url: str) -> str:
+        return os.path.join(
+            self.cache_dir, f"{hashlib.sha256(url.encode()).hexdigest()}.json"
+        )
+
+    def _read(self, url: str) -> Optional[Dict[str, Any]]:
+        try:
+            with open(self._get_path(url), "r") as json_file:
+                return json.load(json_file)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+
+    def _write(self, url: str, entry: Dict[str, Any]) -> None:
+        os.makedirs(self.cache_dir, exist_ok=True)
+        path = self._get_path(url)
+
+        # Write to a temporary file first so a partially written entry is never read
+        temp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(temp_path, "w") as json_file:
+            json.dump(entry, json_file)
+        os.replace(temp_path, path)
+
+
+HTTP_CACHE = HttpCache()
+
+
 # TODO: how to handle when its probowl?
 # it will be an entry in the calendar among the playoffs in postseason.
 # I guess it will also be in the events and we might have trouble forming the machtup (not in the list of team codes)
@@ -68,47 +178,60 @@ def load_matchups(filepath: str) -> List[Matchup]:
     return matchups_list
 
 
-def get_upcoming_matchups() -> List[Matchup]:
-    upcoming_event_urls = _get_upcoming_event_urls()
+def get_upcoming_matchups(base_url: str = BASE_URL) -> List[Matchup]:
+    upcoming_event_urls = _get_upcoming_event_urls(base_url)
 
-    matchups = []
+    with ThreadPoolExecutor(max_workers=MAX_CONCURRENT_REQUESTS) as executor:
+        events = list(executor.map(_get_event_data, upcoming_event_urls))
+        team_urls = [_get_home_and_away_team_urls(event) for event in events]
 
-    for url in upcoming_event_urls:
-        with urllib.request.urlopen(url) as response:
-            event = json.load(response)
+        # Each team only plays once a week but dont rely on it
+        unique_team_urls = list({url for urls in team_urls for url in urls})
+        abbreviations = dict(
+            zip(
+                unique_team_urls,
+                executor.map(_get_team_abbreviation, unique_team_urls),
+            )
+        )
 
-        competitions = event.get("competitions", [])
-        competitionCount = len(competitions)
+    print(f"HTTP cache: {HTTP_CACHE.stats()}")
 
-        if competitionCount != 1:
-            raise ValueError(
-                f"Get upcoming matchup failed. Expected 1 competition, got {competitionCount}."
-            )
+    return [
+        Matchup(abbreviations[home_team_url], abbreviations[away_team_url])
+        for home_team_url, away_team_url in team_urls
+    ]
 
-        competitors = competitions[0].get("competitors", [])
-        home_team = None
-        away_team = None
 
-        for competitor in competitors:
-            home_away = competitor.get("homeAway")
+def _get_home_and_away_team_urls(event: Dict[str, Any]) -> Tuple[str, str]:
+    competitions = event.get("competitions", [])
+    competitionCount = len(competitions)
 
-            # TODO: handle these teams? they are teams foudn in the team page, probably from probowl.
-            #   - AFC, NFC. Probably from Probowl.
-            #   - RICE, IRVIN. ??? Maybe some Probowl thing.
-            # Will I encounter them (probably, if probowl is in the events list)
+    if competitionCount != 1:
+        raise ValueError(
+            f"Get upcoming matchup failed. Expected 1 competition, got {competitionCount}."
+        )
 
-            if home_away == "home":
-                home_team = _get_team_abbreviation(competitor["team"]["$ref"])
-            elif home_away == "away":
-                away_team = _get_team_abbreviation(competitor["team"]["$ref"])
+    competitors = competitions[0].get("competitors", [])
+    home_team_url = None
+    away_team_url = None
 
-        if home_team is None or away_team is None:
-            raise ValueError(
-                "Get upcoming matchup failed. Home or away team not found."
-            )
+    for competitor in competitors:
+        home_away = competitor.get("homeAway")
 
-        matchups.append(Matchup(home_team, away_team))
-    return matchups
+        # TODO: handle these teams? they are teams foudn in the team page, probably from probowl.
+        #   - AFC, NFC. Probably from Probowl.
+        #   - RICE, IRVIN. ??? Maybe some Probowl thing.
+        # Will I encounter them (probably, if probowl is in the events list)
+
+        if home_away == "home":
+            home_team_url = competitor["team"]["$ref"]
+        elif home_away == "away":
+            away_team_url = competitor["team"]["$ref"]
+
+    if home_team_url is None or away_team_url is None:
+        raise ValueError("Get upcoming matchup failed. Home or away team not found.")
+
+    return home_team_url, away_team_url
 
 
 def _get_season_position(calendar_data: Dict[str, Any]) -> SeasonPosition | None:
@@ -133,16 +256,16 @@ def _get_season_position(calendar_data: Dict[str, Any]) -> SeasonPosition | None
     raise ValueError("Could not find current season position")
 
 
-def _get_upcoming_event_urls() -> List[str]:
+def _get_upcoming_event_urls(base_url: str = BASE_URL) -> List[str]:
     # Get calendar to find what the current season is
-    calendar_data = _get_calendar_data()
+    calendar_data = _get_calendar_data(base_url)
 
     season_position = _get_season_position(calendar_data)
 
     # only get events for regular season and postseason, but not regular season week 1
-    if season_position not in [SeasonType.REGULAR, SeasonType.POSTSEASON]:
+    if season_position.type not in [SeasonType.REGULAR, SeasonType.POSTSEASON]:
         return []
-    if season_position is SeasonType.REGULAR and season_position.week == "1":
+    if season_position.type is SeasonType.REGULAR and season_position.week == "1":
         return []
 
     # Get's the current season including the current week
@@ -158,39 +281,61 @@ def _get_upcoming_event_urls() -> List[str]:
     if events_url is None:
         print("Events url not found from season data.")
         raise ValueError("Events url not found.")
-    event_data = _get_event_data(events_url)
+    event_data = HTTP_CACHE.get_json(events_url, CACHE_TTLS["events"])
 
     return [item.get("$ref") for item in event_data.get("items", [])]
 
 
 def _get_team_abbreviation(team_url: str) -> str:
-    with urllib.request.urlopen(team_url) as response:
-        team = json.load(response)
+    team = HTTP_CACHE.get_json(team_url, CACHE_TTLS["team"])
 
     return normalize_team_abbr(team["abbreviation"])
 
 
-def _get_event_data(events_url: str) -> Dict[str, Any]:
-    with urllib.request.urlopen(events_url) as response:
-        events = json.load(response)
+def _get_event_data(event_url: str) -> Dict[str, Any]:
+    return HTTP_CACHE.get_json(event_url, CACHE_TTLS["event"])
 
-    return events
 
+def _get_calendar_data(base_url: str = BASE_URL) -> Dict[str, Any]:
+    blacklist_url = base_url + "calendar/blacklist"
 
-def _get_calendar_data() -> Dict[str, Any]:
-    blacklist_url = BASE_URL + "calendar/blacklist"
-
-    with urllib.request.urlopen(blacklist_url) as response:
-        calendar = json.load(response)
-
-    return calendar
+    return HTTP_CACHE.get_json(blacklist_url, CACHE_TTLS["calendar"])
 
 
 def _get_season_data(season_url: str) -> Dict[str, Any]:
-    with urllib.request.urlopen(season_url) as response:
-        season = json.load(response)
-
-    return season
+    return HTTP_CACHE.get_json(season_url, CACHE_TTLS["season"])
+
+
+def _fetch_json(
+    url: str, headers: Optional[Dict[str, str]] = None
+) -> Tuple[Dict[str, Any], Message]:
+    """
+    GETs and parses json, retrying with backoff on timeouts, connection and server errors.
+    Returns the json and the response headers.
+    """
+    for attempt in range(REQUEST_RETRIES):
+        try:
+            return _get_json(url, headers)
+        except (URLError, TimeoutError) as e:
+            # Client errors (other than rate limiting) won't go away by retrying.
+            # That includes 304 Not Modified, which urllib raises as an error.
+            if isinstance(e, HTTPError) and e.code < 500 and e.code != 429:
+                raise
+
+            backoff = REQUEST_BACKOFF * 2**attempt
+            print(f"Request to {url} failed ({e}). Retrying in {backoff} seconds...")
+            time.sleep(backoff)
+
+    return _get_json(url, headers)
+
+
+def _get_json(
+    url: str, headers: Optional[Dict[str, str]] = None
+) -> Tuple[Dict[str, Any], Message]:
+    request = urllib.request.Request(url, headers=headers or {})
+
+    with urllib.request.urlopen(request, timeout=REQUEST_TIMEOUT) as response:
+        return json.load(response), response.headers
 
 
 if __name__ == "__main__":
@@ -0,0 +1,128 @@
+"""
+Benchmarks aggregating plays into team game stats. Compares the groupby pipeline
+build_game_dataframe used to run (a groupby sum for offense, another for defense,
+a merge and first/last/mean over the offense groups) against the single pass
+kernel. Runs on every downloaded season, so download 1999-present first for the
+full dataset:
+
+    python nfl_analytics/main.py --download
+
+Also checks that both produce the same game stats.
+
+usage: python nfl_analytics/scripts/benchmark_game_aggregation.py [repeats]
+"""
+
+import sys
+import time
+from typing import Callable
+
+import pandas as pd
+from pandas.core.groupby.generic import DataFrameGroupBy
+
+from nfl_analytics.data import load_dataframe_from_raw
+from nfl_analytics.dataframes import build_game_dataframe
+
+
+def build_game_dataframe_groupby(df_raw: pd.DataFrame) -> pd.DataFrame:
+    df_sacks = add_sack_yards(df_raw)
+    df_game_posteam = df_sacks.groupby(["game_id", "posteam"], observed=True)
+    df_game = aggregate_game_stats(df_sacks, df_game_posteam)
+    return adjust_game_dataframe(df_game, df_game_posteam)
+
+
+def add_sack_yards(df_raw: pd.DataFrame) -> pd.DataFrame:
+    df = df_raw.copy()
+    df["sack_yards"] = pd.NA
+    df.loc[df["sack"] != 0, "sack_yards"] = df["yards_gained"]
+
+    return df
+
+
+def aggregate_game_stats(
+    df_sacks: pd.DataFrame, df_game_posteam: DataFrameGroupBy
+) -> pd.DataFrame:
+    columns = ["passing_yards", "rushing_yards", "yards_gained", "sack_yards"]
+
+    offensive_stats = df_game_posteam[columns].sum().reset_index()
+    defensive_stats = (
+        df_sacks.groupby(["game_id", "defteam"], observed=True)[columns]
+        .sum()
+        .reset_index()
+    )
+    defensive_stats.rename(
+        columns={
+            "defteam": "team",
+            **{column: f"{column}_defense" for column in columns},
+        },
+        inplace=True,
+    )
+
+    return pd.merge(
+        offensive_stats,
+        defensive_stats,
+        left_on=["game_id", "posteam"],
+        right_on=["game_id", "team"],
+    )
+
+
+def adjust_game_dataframe(
+    df_game: pd.DataFrame, df_game_posteam: DataFrameGroupBy
+) -> pd.DataFrame:
+    df = df_game.copy()
+
+    df[["home_team", "away_team", "home_score", "away_score"]] = (
+        df_game_posteam[["home_team", "away_team", "home_score", "away_score"]]
+        .first()
+        .reset_index(drop=True)
+    )
+
+    is_home = df["posteam"] == df["home_team"]
+    df["points_scored"] = df["home_score"].where(is_home, df["away_score"])
+    df["points_allowed"] = df["away_score"].where(is_home, df["home_score"])
+
+    df.drop(["posteam"], axis=1, inplace=True)
+
+    df[["score_differential_post", "week", "year"]] = (
+        df_game_posteam[["score_differential_post", "week", "year"]]
+        .last()
+        .reset_index(drop=True)
+    )
+
+    df["mean_epa"] = df_game_posteam["epa"].mean().reset_index(drop=True)
+
+    return df
+
+
+def _time(build: Callable[[pd.DataFrame], pd.DataFrame], df_raw, repeats: int):
+    # Best of several runs, so other work on the machine skews it less
+    times = []
+    for _ in range(repeats):
+        start_time = time.perf_counter()
+        df_game = build(df_raw)
+        times.append(time.perf_counter() - start_time)
+
+    return min(times), df_game
+
+
+def main():
+    repeats = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+
+    df_raw = load_dataframe_from_raw()
+    print(f"{len(df_raw)} plays, {df_raw['year'].nunique()} seasons")
+
+    groupby_time, df_groupby = _time(build_game_dataframe_groupby, df_raw, repeats)
+    kernel_time, df_kernel = _time(build_game_dataframe, df_raw, repeats)
+
+    # The groupby pipeline sums sack yards as objects
+    df_groupby = df_groupby.astype(
+        {"sack_yards": "float32", "sack_yards_defense": "float32"}
+    )
+    pd.testing.assert_frame_equal(df_kernel, df_groupby)
+
+    print(f"groupby: {groupby_time:.3f}s")
+    print(f"single pass: {kernel_time:.3f}s ({groupby_time / kernel_time:.1f}x faster)")
+    print(f"{len(df_kernel)} team games, identical results")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+"""
+Benchmarks loading the raw play by play data. Compares growing the combined
+dataframe with pd.concat for every season (how the loaders used to work) against
+collecting the seasons and concatenating them once. Reads the downloaded csv files
+directly so the cache doesn't skew the timing.
+
+Each approach runs in a fresh process so peak memory isn't shared between runs.
+
+usage: python nfl_analytics/scripts/benchmark_load.py
+"""
+
+import resource
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+from typing import Callable, Tuple
+
+import pandas as pd
+
+from nfl_analytics.data import (
+    concat_play_by_play,
+    get_raw_filenames,
+    read_raw_season,
+)
+
+
+def load_accumulating() -> pd.DataFrame:
+    combined_df = pd.DataFrame()
+
+    for filename in get_raw_filenames():
+        df = read_raw_season(filename)
+        combined_df = concat_play_by_play([combined_df, df])
+
+    return combined_df
+
+
+def load_single_concat() -> pd.DataFrame:
+    return concat_play_by_play(
+        [read_raw_season(filename) for filename in get_raw_filenames()]
+    )
+
+
+def _peak_rss_mb() -> float:
+    # ru_maxrss is in kilobytes on linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _run(load: Callable[[], pd.DataFrame]) -> Tuple[float, float, float, int]:
+    start_rss = _peak_rss_mb()
+    start_time = time.perf_counter()
+    df = load()
+    elapsed = time.perf_counter() - start_time
+
+    return elapsed, start_rss, _peak_rss_mb(), len(df)
+
+
+def main():
+    for load in [load_accumulating, load_single_concat]:
+        with ProcessPoolExecutor(
+            max_workers=1, mp_context=get_context("spawn")
+        ) as executor:
+            elapsed, start_rss, peak_rss, rows = executor.submit(_run, load).result()
+
+        print(
+            f"{load.__name__}: {elapsed:.2f}s, peak rss {peak_rss:.0f} MB "
+            f"({peak_rss - start_rss:.0f} MB over baseline), {rows} rows"
+        )
+
+
+if __name__ == "__main__":
+    main()
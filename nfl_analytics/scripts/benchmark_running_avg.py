@@ -0,0 +1,78 @@
+"""
+Benchmarks building the running averages from the downloaded seasons. Compares
+loading every season's plays into one dataframe and building the running
+averages from it against building each season's running averages on its own
+(in this process, then in one worker process per CPU) and concatenating them.
+
+Each approach runs in a fresh process so peak memory isn't shared between runs.
+Peak memory is the largest of that process and any of its workers.
+
+usage: python nfl_analytics/scripts/benchmark_running_avg.py
+"""
+
+import os
+import resource
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+from typing import Callable, Tuple
+
+import pandas as pd
+
+from nfl_analytics.data import load_dataframe_from_raw
+from nfl_analytics.dataframes import build_running_avg_dataframe
+
+
+def build_from_combined_plays() -> pd.DataFrame:
+    return build_running_avg_dataframe(load_dataframe_from_raw(workers=1))
+
+
+def build_by_season_in_process() -> pd.DataFrame:
+    return build_running_avg_dataframe(workers=1)
+
+
+def build_by_season_in_workers() -> pd.DataFrame:
+    return build_running_avg_dataframe(workers=os.cpu_count())
+
+
+def _peak_rss_mb() -> float:
+    # ru_maxrss is in kilobytes on linux. For children it's the largest child.
+    return (
+        max(
+            resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+            resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss,
+        )
+        / 1024
+    )
+
+
+def _run(build: Callable[[], pd.DataFrame]) -> Tuple[float, float, pd.DataFrame]:
+    start_time = time.perf_counter()
+    df_running_avg = build()
+    elapsed = time.perf_counter() - start_time
+
+    return elapsed, _peak_rss_mb(), df_running_avg
+
+
+def main():
+    results = {}
+    for build in [
+        build_from_combined_plays,
+        build_by_season_in_process,
+        build_by_season_in_workers,
+    ]:
+        with ProcessPoolExecutor(
+            max_workers=1, mp_context=get_context("spawn")
+        ) as executor:
+            results[build.__name__] = executor.submit(_run, build).result()
+
+    _, _, df_expected = results[build_from_combined_plays.__name__]
+    for name, (elapsed, peak_rss, df_running_avg) in results.items():
+        pd.testing.assert_frame_equal(df_running_avg, df_expected)
+        print(f"{name}: {elapsed:.2f}s, peak rss {peak_rss:.0f} MB")
+
+    print(f"{len(df_expected)} rows, identical results")
+
+
+if __name__ == "__main__":
+    main()
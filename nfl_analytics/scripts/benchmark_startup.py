@@ -0,0 +1,102 @@
+"""
+Measures how long CLI commands spend importing modules, using python -X importtime.
+Each command runs in a fresh interpreter. Reports the total import time, the
+wall time of the whole command and the slowest top level imports.
+
+Nothing is downloaded or saved. Commands that would (--download-upcoming-matchups,
+--train and --predict-upcoming) aren't run: only main.py and the modules the
+command imports are, so their wall time is just their startup. --predict is run,
+with the assets the last --train saved.
+
+The last row imports every module the CLI used to import up front, for comparison.
+
+usage: python nfl_analytics/scripts/benchmark_startup.py [runs]
+"""
+
+import os
+import re
+import subprocess
+import sys
+import time
+from typing import Dict, List, Tuple
+
+THIS_DIR = os.path.dirname(os.path.abspath(__file__))
+PACKAGE_DIR = os.path.dirname(THIS_DIR)
+MAIN_PATH = os.path.join(PACKAGE_DIR, "main.py")
+
+
+def _import(*modules: str) -> List[str]:
+    return ["-c", f"import {', '.join(modules)}"]
+
+
+COMMANDS = {
+    "--help": [MAIN_PATH, "--help"],
+    "--download-upcoming-matchups": _import(
+        "nfl_analytics.main", "nfl_analytics.schedule"
+    ),
+    "--train": _import(
+        "nfl_analytics.main",
+        "nfl_analytics.data",
+        "nfl_analytics.dataframes",
+        "nfl_analytics.running_average",
+        "nfl_analytics.model",
+    ),
+    "--predict": [MAIN_PATH, "--predict", "KC", "SF"],
+    "--predict-upcoming latest": _import(
+        "nfl_analytics.main", "nfl_analytics.inference", "nfl_analytics.schedule"
+    ),
+    "all modules": _import(
+        "nfl_analytics.data", "nfl_analytics.dataframes", "nfl_analytics.model"
+    ),
+}
+
+# import time:       self [us] | cumulative | imported package
+IMPORT_TIME_LINE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)")
+
+
+def run_command(args: List[str]) -> Tuple[float, float, Dict[str, int]]:
+    """Returns the wall time, the total import time and the top level imports' cumulative times."""
+    env = {**os.environ, "PYTHONPATH": os.path.dirname(PACKAGE_DIR)}
+
+    start_time = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", *args],
+        capture_output=True,
+        text=True,
+        env=env,
+    )
+    wall_time = time.perf_counter() - start_time
+
+    total_us = 0
+    top_level_us = {}
+    for line in result.stderr.splitlines():
+        match = IMPORT_TIME_LINE.match(line)
+        if match is None:
+            continue
+
+        self_us, cumulative_us, indent, module = match.groups()
+        total_us += int(self_us)
+        # Top level imports are indented by one space
+        if len(indent) == 1:
+            top_level_us[module] = int(cumulative_us)
+
+    return wall_time, total_us / 1e6, top_level_us
+
+
+def main():
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 3
+
+    for name, args in COMMANDS.items():
+        # Best of several runs, the first one may be slowed by a cold disk cache
+        wall_time, import_time, top_level_us = min(
+            (run_command(args) for _ in range(runs)), key=lambda result: result[0]
+        )
+        slowest = sorted(top_level_us.items(), key=lambda item: -item[1])[:3]
+
+        print(f"{name}: {wall_time:.2f}s wall, {import_time:.2f}s importing")
+        for module, cumulative_us in slowest:
+            print(f"    {module}: {cumulative_us / 1e6:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
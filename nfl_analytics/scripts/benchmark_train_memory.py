@@ -0,0 +1,126 @@
+"""
+Measures the memory --train uses with and without pandas' copy-on-write mode.
+The stages run like they do in --train: the running averages are built by the
+default pool of worker processes (one per CPU) and the training matrix and
+model in this process. The training matrix is always built rather than read
+from its cache, and the assets aren't saved.
+
+In this process, tracemalloc (which also traces numpy's arrays) measures for
+each stage:
+
+- peak: the most memory allocated at once during the stage, above what was
+  allocated when it started
+- retained: the memory allocated during the stage that is still allocated after
+  it, e.g. the dataframe it returns. Negative if it freed more than it kept.
+
+Worker processes aren't traced, so for them the peak resident set size of the
+largest worker is reported instead, which includes the interpreter and the
+imported modules. Each mode runs in a
+fresh process so they don't share allocations or workers.
+
+usage: python nfl_analytics/scripts/benchmark_train_memory.py
+"""
+
+import resource
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+from typing import Dict, Optional, Tuple
+
+import pandas as pd
+
+
+def _run(copy_on_write: bool) -> Tuple[Dict[str, Tuple[int, int]], int, Optional[int]]:
+    """
+    Returns the peak and retained memory of each stage, the peak memory of the
+    whole run and the largest worker's peak resident set size (None if the
+    running averages were built without workers, which is the case for a
+    single season).
+    """
+    pd.set_option("mode.copy_on_write", copy_on_write)
+
+    # Imported after setting the mode, like main.py
+    from nfl_analytics.dataframes import (
+        build_running_avg_dataframe,
+        build_training_dataframe,
+    )
+    from nfl_analytics.model import TrainingMatrix, train_model
+
+    stages = {}
+    tracemalloc.start()
+
+    def measure(stage: str, fn):
+        start, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        result = fn()
+        end, peak = tracemalloc.get_traced_memory()
+        stages[stage] = (peak - start, end - start)
+        return result
+
+    # The defaults of --workers and --memory-budget
+    df_running_avg = measure(
+        "running averages",
+        lambda: build_running_avg_dataframe(workers=None, memory_budget_mb=None),
+    )
+    matrix = measure(
+        "training matrix",
+        lambda: TrainingMatrix.from_training_dataframe(
+            build_training_dataframe(df_running_avg)
+        ),
+    )
+    measure("train model", lambda: train_model(matrix))
+
+    # Stages start after the previous ones' results, so the run's peak is the
+    # largest of their peaks on top of what was allocated before them
+    run_peak = 0
+    allocated = 0
+    for peak, retained in stages.values():
+        run_peak = max(run_peak, allocated + peak)
+        allocated += retained
+
+    tracemalloc.stop()
+
+    # Kilobytes on Linux. Only counts worker processes that have exited, which
+    # the pool's workers have once it's shut down.
+    worker_rss = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * 1024
+
+    return stages, run_peak, worker_rss or None
+
+
+def main():
+    results = {}
+    for copy_on_write in [False, True]:
+        with ProcessPoolExecutor(
+            max_workers=1, mp_context=get_context("spawn")
+        ) as executor:
+            results[copy_on_write] = executor.submit(_run, copy_on_write).result()
+
+    (stages, run_peak, worker_rss), (cow_stages, cow_run_peak, cow_worker_rss) = (
+        results[False],
+        results[True],
+    )
+
+    print("MB allocated in this process, without -> with copy-on-write")
+    for stage, (peak, retained) in stages.items():
+        cow_peak, cow_retained = cow_stages[stage]
+        print(
+            f"{stage}: peak {peak / 2**20:.1f} -> {cow_peak / 2**20:.1f}, "
+            f"retained {retained / 2**20:.1f} -> {cow_retained / 2**20:.1f}"
+        )
+
+    print(
+        f"peak over the whole run: {run_peak / 2**20:.1f} -> {cow_run_peak / 2**20:.1f} "
+        f"({cow_run_peak / run_peak - 1:+.0%})"
+    )
+
+    if worker_rss is None or cow_worker_rss is None:
+        print("running averages were built in this process, without workers")
+    else:
+        print(
+            f"largest worker's peak resident set size: {worker_rss / 2**20:.1f} -> "
+            f"{cow_worker_rss / 2**20:.1f} MB"
+        )
+
+
+if __name__ == "__main__":
+    main()
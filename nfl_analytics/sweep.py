@@ -0,0 +1,170 @@
+"""
+Evaluates a grid of estimators and subsets of FEATURES without rebuilding the
+training data for each one. The training matrix is built once and saved as .npy
+files that every worker process memory maps read-only, so the workers share the
+same pages instead of each getting a copy.
+
+Each configuration is trained on a random 80% of the games (the same games for
+every configuration) and scored on the other 20%. Unlike train_model's split,
+both of a game's rows (one per team, with the same features and spread) are
+always on the same side, otherwise models that can memorize rows, like random
+forests, are scored on games they were trained on. Missing values are filled
+with the training rows' means and the features are scaled before fitting.
+"""
+
+import os
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+from sklearn.base import RegressorMixin
+from sklearn.ensemble import HistGradientBoostingRegressor, RandomForestRegressor
+from sklearn.impute import SimpleImputer
+from sklearn.linear_model import Lasso, LinearRegression, Ridge
+from sklearn.metrics import mean_absolute_error, mean_squared_error
+from sklearn.model_selection import GroupShuffleSplit
+from sklearn.pipeline import make_pipeline
+from sklearn.preprocessing import StandardScaler
+
+from nfl_analytics.config import FEATURES, SWEEP_FILENAME
+from nfl_analytics.model import ASSET_DIR, TrainingMatrix
+
+# Functions rather than instances, so each worker builds its own unfitted estimator
+ESTIMATORS: Dict[str, Callable[[], RegressorMixin]] = {
+    "linear_regression": LinearRegression,
+    "ridge": lambda: Ridge(alpha=10.0),
+    "lasso": lambda: Lasso(alpha=0.1),
+    "random_forest": lambda: RandomForestRegressor(
+        n_estimators=100, min_samples_leaf=20, random_state=42
+    ),
+    "gradient_boosting": lambda: HistGradientBoostingRegressor(random_state=42),
+}
+
+# Set in each worker by _open_shared_matrix
+_shared_matrix: Dict[str, np.ndarray] = {}
+
+
+def get_feature_subsets() -> Dict[str, List[str]]:
+    """All of FEATURES, and FEATURES without each stat (both its home and away average)."""
+    stats = list(dict.fromkeys(feature.split("_", 1)[1] for feature in FEATURES))
+
+    subsets = {"all": FEATURES}
+    for stat in stats:
+        subsets[f"without {stat}"] = [
+            feature for feature in FEATURES if feature.split("_", 1)[1] != stat
+        ]
+
+    return subsets
+
+
+def sweep(
+    matrix: TrainingMatrix,
+    estimators: Optional[List[str]] = None,
+    feature_subsets: Optional[Dict[str, List[str]]] = None,
+    workers: Optional[int] = None,
+) -> pd.DataFrame:
+    """
+    Scores every combination of estimator (names from ESTIMATORS, all of them by
+    default) and feature subset (get_feature_subsets() by default) in a pool of
+    `workers` processes (defaults to the number of CPUs). Returns one row per
+    configuration, best (lowest mean absolute error) first.
+    """
+    if estimators is None:
+        estimators = list(ESTIMATORS)
+
+    if feature_subsets is None:
+        feature_subsets = get_feature_subsets()
+
+    configs = [
+        (estimator, subset, [FEATURES.index(feature) for feature in features])
+        for estimator in estimators
+        for subset, features in feature_subsets.items()
+    ]
+
+    with tempfile.TemporaryDirectory() as shared_dir:
+        _save_shared_matrix(matrix, shared_dir)
+
+        with ProcessPoolExecutor(
+            max_workers=workers,
+            initializer=_open_shared_matrix,
+            initargs=(shared_dir,),
+        ) as executor:
+            results = list(executor.map(_evaluate, *zip(*configs)))
+
+    df_sweep = pd.DataFrame(
+        results,
+        columns=["estimator", "features", "feature_count", "mae", "mse", "fit_seconds"],
+    )
+
+    return df_sweep.sort_values("mae", kind="stable", ignore_index=True)
+
+
+def _save_shared_matrix(matrix: TrainingMatrix, shared_dir: str) -> None:
+    [(train_rows, test_rows)] = GroupShuffleSplit(
+        n_splits=1, test_size=0.2, random_state=42
+    ).split(matrix.X, groups=matrix.game)
+
+    for name, array in [
+        ("X", matrix.X),
+        ("y", matrix.y),
+        ("train_rows", train_rows),
+        ("test_rows", test_rows),
+    ]:
+        np.save(os.path.join(shared_dir, f"{name}.npy"), array)
+
+
+def _open_shared_matrix(shared_dir: str) -> None:
+    for name in ["X", "y", "train_rows", "test_rows"]:
+        _shared_matrix[name] = np.load(
+            os.path.join(shared_dir, f"{name}.npy"), mmap_mode="r"
+        )
+
+
+def _evaluate(
+    estimator: str, subset: str, feature_indexes: List[int]
+) -> Tuple[str, str, int, float, float, float]:
+    X = _shared_matrix["X"]
+    y = _shared_matrix["y"]
+    train_rows = _shared_matrix["train_rows"]
+    test_rows = _shared_matrix["test_rows"]
+
+    # Fancy indexing reads the memory mapped rows into new arrays for this fit only
+    X_train = X[train_rows][:, feature_indexes]
+    X_test = X[test_rows][:, feature_indexes]
+
+    model = make_pipeline(
+        SimpleImputer(strategy="mean"), StandardScaler(), ESTIMATORS[estimator]()
+    )
+
+    start_time = time.perf_counter()
+    model.fit(X_train, y[train_rows])
+    fit_seconds = time.perf_counter() - start_time
+
+    y_pred = model.predict(X_test)
+
+    return (
+        estimator,
+        subset,
+        len(feature_indexes),
+        mean_absolute_error(y[test_rows], y_pred),
+        mean_squared_error(y[test_rows], y_pred),
+        fit_seconds,
+    )
+
+
+def save_sweep(df_sweep: pd.DataFrame, timestamp: int) -> None:
+    os.makedirs(ASSET_DIR, exist_ok=True)
+
+    filename = f"{SWEEP_FILENAME}-{timestamp}.csv"
+    df_sweep.to_csv(os.path.join(ASSET_DIR, filename), index=False)
+    print(f"Sweep results saved to {filename}")
+
+
+if __name__ == "__main__":
+    from nfl_analytics.dataframes import build_training_dataframe
+
+    matrix = TrainingMatrix.from_training_dataframe(build_training_dataframe())
+    print(sweep(matrix).head(10))
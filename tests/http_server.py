@@ -0,0 +1,160 @@
+"""
+A local HTTP server standing in for ESPN's API and the nflverse downloads, so
+the clients can be tested without the network. The ESPN fixtures in
+docs/sample_data link to each other with absolute URLs, which
+rewrite_espn_refs points at the local server instead.
+"""
+
+import json
+import os
+import re
+import threading
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional
+from urllib.parse import urlsplit
+
+SAMPLE_DATA_DIR = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)),
+    "..",
+    "nfl_analytics",
+    "docs",
+    "sample_data",
+)
+ESPN_URL_PATTERN = re.compile(r"https?://sports\.core\.api\.espn\.com/")
+
+
+@dataclass
+class Response:
+    body: bytes
+    etag: Optional[str] = None
+
+
+class LocalServer:
+    """
+    Serves the responses added to it on a free port of localhost. Responses are
+    looked up by path, ignoring the query string. Use it as a context manager.
+    """
+
+    def __init__(self):
+        self.responses: Dict[str, Response] = {}
+        # path -> statuses to fail the next requests for the path with
+        self.failures: Dict[str, List[int]] = {}
+        # path -> bytes to send of the next response for the path before closing the connection
+        self.interruptions: Dict[str, int] = {}
+        # path -> headers of each request for the path
+        self.requests: Dict[str, List[Dict[str, str]]] = {}
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), _make_handler(self))
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self._server.server_address[1]}/"
+
+    def add(self, path: str, body: bytes, etag: Optional[str] = None) -> None:
+        self.responses[path] = Response(body, etag)
+
+    def add_espn_document(self, document: Dict[str, Any]) -> None:
+        """Serves an ESPN document at the path of its own $ref, with its refs rewritten."""
+        document = rewrite_espn_refs(document, self.url)
+        path = urlsplit(document["$ref"]).path.lstrip("/")
+        self.add(path, json.dumps(document).encode())
+
+    def fail(self, path: str, *statuses: int) -> None:
+        self.failures.setdefault(path, []).extend(statuses)
+
+    def interrupt(self, path: str, after_bytes: int) -> None:
+        self.interruptions[path] = after_bytes
+
+    def __enter__(self) -> "LocalServer":
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+
+def _make_handler(server: LocalServer) -> type:
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self) -> None:
+            path = urlsplit(self.path).path.lstrip("/")
+
+            with server._lock:
+                server.requests.setdefault(path, []).append(dict(self.headers))
+                failures = server.failures.get(path)
+                status = failures.pop(0) if failures else None
+                interrupt_after = server.interruptions.pop(path, None)
+
+            response = server.responses.get(path)
+
+            if status is not None:
+                self.send_error(status)
+            elif response is None:
+                self.send_error(404)
+            elif response.etag and self.headers.get("If-None-Match") == response.etag:
+                self.send_response(304)
+                self.end_headers()
+            elif self._get_range_start(response) is not None:
+                self._send_range(response, interrupt_after)
+            else:
+                self.send_response(200)
+                self._send_body(response, response.body, interrupt_after)
+
+        def _get_range_start(self, response: Response) -> Optional[int]:
+            # Only "bytes=<start>-" ranges, which is what resumed downloads ask for
+            match = re.fullmatch(r"bytes=(\d+)-", self.headers.get("Range", ""))
+            if_range = self.headers.get("If-Range")
+
+            # If-Range not matching means the file changed, so all of it is sent
+            if match is None or (if_range is not None and if_range != response.etag):
+                return None
+
+            return int(match.group(1))
+
+        def _send_range(
+            self, response: Response, interrupt_after: Optional[int]
+        ) -> None:
+            start = self._get_range_start(response)
+            size = len(response.body)
+
+            if start >= size:
+                self.send_response(416)
+                self.send_header("Content-Range", f"bytes */{size}")
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+
+            self.send_response(206)
+            self.send_header("Content-Range", f"bytes {start}-{size - 1}/{size}")
+            self._send_body(response, response.body[start:], interrupt_after)
+
+        def _send_body(
+            self, response: Response, body: bytes, interrupt_after: Optional[int]
+        ) -> None:
+            self.send_header("Content-Length", str(len(body)))
+            if response.etag:
+                self.send_header("ETag", response.etag)
+            self.end_headers()
+
+            if interrupt_after is None:
+                self.wfile.write(body)
+            else:
+                # The connection is closed with the rest of the body still to come
+                self.wfile.write(body[:interrupt_after])
+                self.close_connection = True
+
+        def log_message(self, format: str, *args: Any) -> None:
+            pass
+
+    return Handler
+
+
+def load_sample_data(filename: str) -> Dict[str, Any]:
+    with open(os.path.join(SAMPLE_DATA_DIR, filename), "r") as json_file:
+        return json.load(json_file)
+
+
+def rewrite_espn_refs(document: Dict[str, Any], base_url: str) -> Dict[str, Any]:
+    """A copy of document with its absolute ESPN URLs pointing at base_url instead."""
+    return json.loads(ESPN_URL_PATTERN.sub(base_url, json.dumps(document)))
@@ -0,0 +1,93 @@
+"""
+Downloads seasons from a local server, to check that unchanged files aren't
+downloaded again and interrupted downloads are resumed without a partial file
+ever being saved as the season.
+"""
+
+import os
+
+import pytest
+
+import nfl_analytics.data as data
+from nfl_analytics.data import _download_file, _fetch_season
+from tests.http_server import LocalServer
+
+YEAR = 2023
+FILENAME = f"play_by_play_{YEAR}.csv.gz"
+ETAG = '"v1"'
+# Any bytes will do, the downloads are checked without parsing them
+BODY = os.urandom(64 * 1024)
+
+
+@pytest.fixture
+def server():
+    with LocalServer() as server:
+        server.add(FILENAME, BODY, ETAG)
+        yield server
+
+
+@pytest.fixture
+def save_path(tmp_path) -> str:
+    return str(tmp_path / FILENAME)
+
+
+def fetch_season(server: LocalServer, save_path: str):
+    return _fetch_season(
+        YEAR, server.url, lambda url, filename: _download_file(url, save_path)
+    )
+
+
+def read_file(path: str) -> bytes:
+    with open(path, "rb") as file:
+        return file.read()
+
+
+def test_download_skips_unchanged_file(server, save_path):
+    assert fetch_season(server, save_path) == FILENAME
+    assert fetch_season(server, save_path) is None
+
+    first_request, second_request = server.requests[FILENAME]
+    assert "If-None-Match" not in first_request
+    # Answered with 304 Not Modified
+    assert second_request["If-None-Match"] == ETAG
+    assert read_file(save_path) == BODY
+
+
+def test_download_resumes_interrupted_download(server, save_path):
+    # The season was downloaded before and has changed since
+    with open(save_path, "wb") as file:
+        file.write(b"previous version")
+    server.interrupt(FILENAME, len(BODY) // 3)
+
+    with pytest.raises(ConnectionError):
+        _download_file(server.url + FILENAME, save_path)
+
+    # The interrupted download never replaces the saved season
+    assert read_file(save_path) == b"previous version"
+    assert read_file(f"{save_path}.part") == BODY[: len(BODY) // 3]
+
+    assert fetch_season(server, save_path) == FILENAME
+
+    resumed_request = server.requests[FILENAME][-1]
+    assert resumed_request["Range"] == f"bytes={len(BODY) // 3}-"
+    assert read_file(save_path) == BODY
+    assert not os.path.exists(f"{save_path}.part")
+    assert not os.path.exists(f"{save_path}.part.json")
+
+
+def test_download_retries_unsatisfiable_range(server, save_path, capsys):
+    # A partial download longer than the remote file, which the server can't resume
+    with open(f"{save_path}.part", "wb") as file:
+        file.write(BODY + b"more")
+    data._write_download_metadata(
+        f"{save_path}.part", {"etag": ETAG, "last_modified": None, "size": None}
+    )
+
+    assert fetch_season(server, save_path) == FILENAME
+
+    assert [request.get("Range") for request in server.requests[FILENAME]] == [
+        f"bytes={len(BODY) + 4}-",
+        None,
+    ]
+    assert read_file(save_path) == BODY
+    assert "may not exist" not in capsys.readouterr().out
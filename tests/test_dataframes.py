@@ -0,0 +1,375 @@
+"""
+Compares the dataframes the pipeline builds against the original row by row
+implementations (DataFrame.apply(axis=1) and the per-column groupby pipeline),
+on a small generated season, and the ways of building the running averages
+against each other.
+"""
+
+from typing import List
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import nfl_analytics.data as data
+import nfl_analytics.running_average as running_average
+from nfl_analytics.data import _add_year, concat_play_by_play, read_play_by_play_csv
+from nfl_analytics.dataframes import (
+    build_game_dataframe,
+    build_running_avg_dataframe,
+    build_training_dataframe,
+    running_mean,
+)
+from nfl_analytics.running_average import (
+    RunningAverageState,
+    build_running_avg_dataframe_incremental,
+)
+
+TEAMS = ["BUF", "DET", "KC", "SF"]
+YEAR = 2023
+
+
+def make_season_plays(
+    year: int = YEAR, teams: List[str] = TEAMS, seed: int = 0
+) -> pd.DataFrame:
+    """Plays for a 6 week season of 4 teams, with the raw data's missing values."""
+    rng = np.random.default_rng(seed)
+    plays = []
+
+    for week in range(1, 7):
+        order = rng.permutation(teams)
+        for home_team, away_team in [order[:2], order[2:]]:
+            game_id = f"{year}_{week:02d}_{away_team}_{home_team}"
+            home_score, away_score = rng.integers(0, 40, size=2)
+
+            for play in range(40):
+                posteam, defteam = (
+                    (home_team, away_team) if play % 2 == 0 else (away_team, home_team)
+                )
+                # Plays like timeouts and the end of a quarter have no teams or stats
+                no_play = rng.random() < 0.1
+                is_pass = rng.random() < 0.6
+                sack = float(is_pass and rng.random() < 0.1)
+                yards_gained = float(rng.integers(-10, 30))
+
+                plays.append(
+                    {
+                        "game_id": game_id,
+                        "week": week,
+                        "home_team": home_team,
+                        "away_team": away_team,
+                        "posteam": None if no_play else posteam,
+                        "defteam": None if no_play else defteam,
+                        "home_score": home_score,
+                        "away_score": away_score,
+                        "score_differential_post": (
+                            np.nan
+                            if rng.random() < 0.05
+                            else float(rng.integers(-21, 22))
+                        ),
+                        "passing_yards": (
+                            yards_gained if is_pass and not sack else np.nan
+                        ),
+                        "rushing_yards": np.nan if is_pass else yards_gained,
+                        "yards_gained": np.nan if no_play else yards_gained,
+                        "sack": np.nan if no_play else sack,
+                        "epa": np.nan if no_play else rng.normal(0, 1.5),
+                    }
+                )
+
+    return pd.DataFrame(plays)
+
+
+@pytest.fixture(scope="module")
+def df_raw(tmp_path_factory) -> pd.DataFrame:
+    # Read through the same parser as downloaded seasons, so the dtypes match
+    path = tmp_path_factory.mktemp("data") / f"play_by_play_{YEAR}.csv.gz"
+    make_season_plays().to_csv(path, index=False, compression="gzip")
+
+    return _add_year(read_play_by_play_csv(str(path)), YEAR)
+
+
+@pytest.fixture
+def data_dir(tmp_path, monkeypatch) -> str:
+    """A data directory with two downloaded seasons whose teams differ."""
+    monkeypatch.setattr(data, "DATA_DIR", str(tmp_path))
+    monkeypatch.setattr(data, "CACHE_DIR", str(tmp_path / "cache"))
+    monkeypatch.setattr(
+        running_average,
+        "RUNNING_AVG_CACHE_DIR",
+        str(tmp_path / "cache" / "running_average"),
+    )
+
+    for year, teams in [(2019, ["BUF", "KC", "OAK", "SF"]), (2020, TEAMS)]:
+        make_season_plays(year, teams, seed=year).to_csv(
+            tmp_path / f"play_by_play_{year}.csv.gz", index=False, compression="gzip"
+        )
+
+    return str(tmp_path)
+
+
+def build_game_dataframe_apply(df_raw: pd.DataFrame) -> pd.DataFrame:
+    """How build_game_dataframe used to aggregate plays."""
+    df_sacks = df_raw.copy()
+    df_sacks["sack_yards"] = pd.NA
+    df_sacks.loc[df_sacks["sack"] != 0, "sack_yards"] = df_sacks["yards_gained"]
+
+    columns = ["passing_yards", "rushing_yards", "yards_gained", "sack_yards"]
+    df_game_posteam = df_sacks.groupby(["game_id", "posteam"], observed=True)
+    offensive_stats = df_game_posteam[columns].sum().reset_index()
+    defensive_stats = (
+        df_sacks.groupby(["game_id", "defteam"], observed=True)[columns]
+        .sum()
+        .reset_index()
+        .rename(
+            columns={
+                "defteam": "team",
+                **{column: f"{column}_defense" for column in columns},
+            }
+        )
+    )
+    df = pd.merge(
+        offensive_stats,
+        defensive_stats,
+        left_on=["game_id", "posteam"],
+        right_on=["game_id", "team"],
+    )
+
+    df[["home_team", "away_team", "home_score", "away_score"]] = (
+        df_game_posteam[["home_team", "away_team", "home_score", "away_score"]]
+        .first()
+        .reset_index(drop=True)
+    )
+    df["points_scored"] = df.apply(
+        lambda row: (
+            row["home_score"]
+            if row["posteam"] == row["home_team"]
+            else row["away_score"]
+        ),
+        axis=1,
+    )
+    df["points_allowed"] = df.apply(
+        lambda row: (
+            row["away_score"]
+            if row["posteam"] == row["home_team"]
+            else row["home_score"]
+        ),
+        axis=1,
+    )
+    df = df.drop(["posteam"], axis=1)
+
+    df[["score_differential_post", "week", "year"]] = (
+        df_game_posteam[["score_differential_post", "week", "year"]]
+        .last()
+        .reset_index(drop=True)
+    )
+    df["mean_epa"] = df_game_posteam["epa"].mean().reset_index(drop=True)
+
+    return df
+
+
+def get_home_spread_apply(df_game: pd.DataFrame) -> pd.Series:
+    """How build_running_avg_dataframe used to set the home_spread."""
+    return df_game.apply(
+        lambda row: (
+            -row["score_differential_post"]
+            if row["team"] != row["home_team"]
+            else row["score_differential_post"]
+        ),
+        axis=1,
+    )
+
+
+def build_training_dataframe_apply(df_running_avg: pd.DataFrame) -> pd.DataFrame:
+    """How build_training_dataframe used to squash each game's rows."""
+    df_running_avg = df_running_avg.copy()
+    df_running_avg["is_home"] = df_running_avg.apply(
+        lambda row: True if row["team"] == row["home_team"] else False, axis=1
+    )
+
+    avg_columns = [column for column in df_running_avg if column.endswith("_avg")]
+    squashed_df = (
+        df_running_avg.groupby(["game_id", "is_home"], observed=True)[avg_columns]
+        .first()
+        .unstack()
+    )
+    squashed_df.columns = [
+        f"{'home' if is_home else 'away'}_{col}" for col, is_home in squashed_df.columns
+    ]
+    squashed_df.reset_index(inplace=True)
+
+    return pd.merge(
+        df_running_avg[
+            [
+                "game_id",
+                "week",
+                "year",
+                "team",
+                "home_team",
+                "away_team",
+                "home_spread",
+            ]
+        ],
+        squashed_df,
+        on="game_id",
+    )
+
+
+def test_game_dataframe_matches_apply(df_raw):
+    df_game = build_game_dataframe(df_raw)
+    df_expected = build_game_dataframe_apply(df_raw)
+
+    # The old pipeline summed sack yards as objects and made python ints of the points
+    df_expected = df_expected.astype(
+        {
+            "sack_yards": "float32",
+            "sack_yards_defense": "float32",
+            "points_scored": df_game["points_scored"].dtype,
+            "points_allowed": df_game["points_allowed"].dtype,
+        }
+    )
+
+    assert len(df_game) == 2 * 12
+    pd.testing.assert_frame_equal(df_game, df_expected, check_exact=True)
+
+
+def test_game_dataframe_from_plain_dataframe(df_raw, tmp_path):
+    # Read without the pipeline's dtypes, so the teams are strings
+    path = tmp_path / "plays.csv"
+    df_raw.to_csv(path, index=False)
+    df_plain = pd.read_csv(path)
+
+    pd.testing.assert_frame_equal(
+        build_game_dataframe(df_plain),
+        build_game_dataframe(df_raw),
+        check_dtype=False,
+        check_categorical=False,
+    )
+
+
+def test_home_spread_matches_apply(df_raw):
+    df_game = build_game_dataframe(df_raw)
+    df_running_avg = build_running_avg_dataframe(df_raw)
+
+    pd.testing.assert_series_equal(
+        df_running_avg["home_spread"],
+        get_home_spread_apply(df_game).astype("float64"),
+        check_names=False,
+        check_exact=True,
+    )
+
+
+def test_training_dataframe_matches_apply(df_raw):
+    df_running_avg = build_running_avg_dataframe(df_raw)
+    df_columns = df_running_avg.copy()
+
+    df_training = build_training_dataframe(df_running_avg)
+    df_expected = build_training_dataframe_apply(df_running_avg)
+
+    pd.testing.assert_frame_equal(df_training, df_expected, check_exact=True)
+    # The running averages passed in are left as they were
+    pd.testing.assert_frame_equal(df_running_avg, df_columns)
+
+
+@pytest.mark.parametrize("window", [1, 3, 8])
+def test_windowed_running_mean_matches_rolling(window):
+    rng = np.random.default_rng(0)
+    df = pd.DataFrame(
+        {
+            "team": pd.Categorical(rng.choice(TEAMS, size=400)),
+            "a": rng.normal(0, 100, size=400),
+            "b": rng.normal(0, 1, size=400),
+        }
+    )
+    df.loc[rng.random(400) < 0.2, "a"] = np.nan
+    df.loc[rng.random(400) < 0.5, "b"] = np.nan
+
+    expected = df.groupby("team", observed=True)[["a", "b"]].transform(
+        lambda x: x.shift().rolling(window, min_periods=1).mean()
+    )
+
+    # The window's sum is the difference of two cumulative sums, so it can be a
+    # rounding error off where the rolling mean sums just the window
+    pd.testing.assert_frame_equal(
+        running_mean(df, ["team"], ["a", "b"], window=window),
+        expected,
+        check_exact=False,
+        rtol=1e-9,
+        atol=1e-9,
+    )
+
+
+def test_incremental_running_avg_matches_default(data_dir):
+    df_expected = build_running_avg_dataframe(workers=1)
+
+    # Built, then read from the saved seasons
+    for _ in range(2):
+        pd.testing.assert_frame_equal(
+            build_running_avg_dataframe_incremental(), df_expected, check_exact=True
+        )
+
+
+def test_running_avg_state_adds_rest_of_partial_week(df_raw):
+    state = RunningAverageState()
+    df_weeks = []
+
+    for week in range(1, 7):
+        df_played = df_raw[df_raw["week"] <= week]
+        first_game = df_played.loc[df_played["week"] == week, "game_id"].iloc[0]
+
+        # Run after the week's first game, then again once the week is over
+        df_weeks.append(state.update(df_played[df_played["game_id"] == first_game]))
+        df_weeks.append(state.update(df_played))
+
+    df_running_avg = concat_play_by_play(df_weeks).sort_values(
+        ["game_id", "team"], kind="stable", ignore_index=True
+    )
+
+    pd.testing.assert_frame_equal(
+        df_running_avg, build_running_avg_dataframe(df_raw), check_exact=True
+    )
+
+
+def test_running_avg_state_rejects_changed_game(df_raw):
+    # The first game was still being played when it was added
+    state = RunningAverageState()
+    state.update(df_raw.iloc[10:])
+    games = dict(state.games)
+
+    with pytest.raises(ValueError):
+        state.update(df_raw)
+    assert state.games == games
+
+
+def test_incremental_running_avg_adds_new_games(data_dir, tmp_path):
+    path = tmp_path / "play_by_play_2020.csv.gz"
+    df_season = make_season_plays(2020, TEAMS, seed=2020)
+    # The season so far, up to the middle of week 4
+    first_game = df_season.loc[df_season["week"] == 4, "game_id"].iloc[0]
+    df_partial = df_season[
+        (df_season["week"] < 4) | (df_season["game_id"] == first_game)
+    ]
+
+    for df_plays in [df_partial, df_season]:
+        df_plays.to_csv(path, index=False, compression="gzip")
+
+        pd.testing.assert_frame_equal(
+            build_running_avg_dataframe_incremental(),
+            build_running_avg_dataframe(workers=1),
+            check_exact=True,
+        )
+
+
+def test_incremental_running_avg_rebuilds_changed_season(data_dir, tmp_path):
+    path = tmp_path / "play_by_play_2020.csv.gz"
+    build_running_avg_dataframe_incremental()
+
+    # A past game's plays corrected in the re-downloaded season
+    df_season = make_season_plays(2020, TEAMS, seed=2020)
+    df_season.drop(index=0).to_csv(path, index=False, compression="gzip")
+
+    pd.testing.assert_frame_equal(
+        build_running_avg_dataframe_incremental(),
+        build_running_avg_dataframe(workers=1),
+        check_exact=True,
+    )
@@ -0,0 +1,131 @@
+"""
+Checks the running averages predictions are made from, as they're looked up
+from a RunningAvgLookup (built from a dataframe or loaded from its saved file)
+and from a TeamSnapshot, and that teams without them aren't predicted. Also
+checks which rows of the training dataframe are trained on.
+"""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from nfl_analytics.config import FEATURES, RUNNING_AVG_COLUMNS, TEAMS as ALL_TEAMS
+from nfl_analytics.inference import LinearModelParams, TeamSnapshot, predict_spreads
+from nfl_analytics.model import RunningAvgLookup, TrainingMatrix, make_matchup
+from nfl_analytics.schedule import Matchup
+
+TEAMS = ["BUF", "DET", "KC", "SF"]
+YEARS = [2022, 2023]
+WEEKS = range(1, 5)
+
+
+def make_running_avg(seed: int = 0) -> pd.DataFrame:
+    """Running averages of two seasons, where BUF is on bye the last week."""
+    rng = np.random.default_rng(seed)
+    rows = [
+        (year, week, team)
+        for year in YEARS
+        for week in WEEKS
+        for team in TEAMS
+        if not (week == WEEKS[-1] and team == "BUF")
+    ]
+    df = pd.DataFrame(rows, columns=["year", "week", "team"])
+    df["team"] = df["team"].astype("category")
+
+    for column in RUNNING_AVG_COLUMNS.values():
+        df[column] = rng.normal(0, 100, size=len(df))
+    df.loc[rng.random(len(df)) < 0.1, "rushing_avg"] = np.nan
+
+    # Game order, not sorted by team
+    return df.sample(frac=1, random_state=seed, ignore_index=True)
+
+
+@pytest.fixture
+def df_running_avg() -> pd.DataFrame:
+    return make_running_avg()
+
+
+@pytest.mark.parametrize("saved", [False, True])
+def test_lookup_gets_each_row(df_running_avg, tmp_path, saved):
+    lookup = RunningAvgLookup(df_running_avg)
+    if saved:
+        lookup.save(str(tmp_path / "running_average.npy"))
+        lookup = RunningAvgLookup.load(str(tmp_path / "running_average.npy"))
+
+    columns = list(RUNNING_AVG_COLUMNS.values())
+    for row in df_running_avg.itertuples(index=False):
+        np.testing.assert_array_equal(
+            lookup.get(row.year, row.week, row.team),
+            [getattr(row, column) for column in columns],
+        )
+
+    assert lookup.latest_year == YEARS[-1]
+    assert lookup.last_week(YEARS[0]) == WEEKS[-1]
+    np.testing.assert_array_equal(
+        lookup.get(YEARS[0], WEEKS[-1] + 1, "KC"),
+        lookup.get(YEARS[0], WEEKS[-1], "KC"),
+    )
+    assert np.isnan(lookup.get(YEARS[0], WEEKS[-1], "NYJ")).all()
+    with pytest.raises(KeyError):
+        lookup.last_week(YEARS[-1] + 1)
+
+
+def test_make_matchup_uses_modified_dataframe(df_running_avg):
+    make_matchup(df_running_avg, "KC", "SF")
+
+    is_kc = df_running_avg["team"] == "KC"
+    df_running_avg.loc[is_kc, "rushing_avg"] = 999.0
+
+    assert make_matchup(df_running_avg, "KC", "SF")["home_rushing_avg"][0] == 999.0
+
+
+def test_snapshot_matches_lookup(df_running_avg):
+    snapshot = TeamSnapshot.from_dataframe(df_running_avg)
+    lookup = RunningAvgLookup(df_running_avg)
+    year, week = snapshot.year, lookup.last_week(lookup.latest_year)
+
+    assert (year, week) == (YEARS[-1], WEEKS[-1])
+    # Including BUF, which is on bye, and teams without any running averages
+    for team in ALL_TEAMS:
+        np.testing.assert_array_equal(
+            snapshot.get(year, week, team), lookup.get(year, week, team)
+        )
+
+
+def test_predict_spreads_rejects_team_without_running_averages(df_running_avg):
+    feature_count = len(FEATURES)
+    params = LinearModelParams(
+        np.zeros(feature_count), np.ones(feature_count), np.ones(feature_count), 0.0
+    )
+    lookup = RunningAvgLookup(df_running_avg.fillna({"rushing_avg": 0.0}))
+
+    [prediction] = predict_spreads(params, lookup, [Matchup("KC", "SF")])
+    assert np.isfinite(prediction.spread)
+
+    with pytest.raises(ValueError, match="NYJ"):
+        predict_spreads(params, lookup, [Matchup("KC", "SF"), Matchup("BUF", "NYJ")])
+
+
+def test_training_matrix_leaves_out_rows_without_target():
+    rng = np.random.default_rng(0)
+    df_training = pd.DataFrame(
+        {
+            "game_id": [
+                f"2023_{week:02d}_{game}" for week in [3, 1, 2] for game in "AB"
+            ],
+            "year": 2023,
+            "week": [3, 3, 1, 1, 2, 2],
+            "home_spread": [3.0, np.nan, 7.0, -7.0, -3.0, 10.0],
+        }
+    )
+    for feature in FEATURES:
+        df_training[feature] = rng.normal(size=len(df_training))
+
+    matrix = TrainingMatrix.from_training_dataframe(df_training)
+
+    # Week 1 has no running averages to train on, and 2023_03_B has no result
+    np.testing.assert_array_equal(matrix.week, [2, 2, 3])
+    np.testing.assert_array_equal(matrix.y, [-3.0, 10.0, 3.0])
+    np.testing.assert_array_equal(
+        matrix.X, df_training.loc[[4, 5, 0], FEATURES].to_numpy(dtype="float32")
+    )
@@ -0,0 +1,89 @@
+"""
+Checks the model solved from the saved sums against fitting it on all of the
+rows from scratch, as weeks are added, partly added and changed.
+"""
+
+import numpy as np
+import pytest
+
+from nfl_analytics.backtest import fit_and_predict
+from nfl_analytics.config import FEATURES
+from nfl_analytics.model import TrainingMatrix
+from nfl_analytics.regression_stats import SeasonRegressionStats
+
+YEARS = [2022, 2023]
+WEEKS = range(2, 8)
+ROWS_PER_WEEK = 8
+
+
+def make_matrix(seed: int = 0) -> TrainingMatrix:
+    rng = np.random.default_rng(seed)
+    year, week = np.array(
+        [(year, week) for year in YEARS for week in WEEKS for _ in range(ROWS_PER_WEEK)]
+    ).T
+
+    X = rng.normal(size=(len(year), len(FEATURES)))
+    X[rng.random(X.shape) < 0.05] = np.nan
+    y = np.nan_to_num(X) @ rng.normal(size=len(FEATURES)) + rng.normal(size=len(year))
+
+    return TrainingMatrix(X, y, year, week, np.arange(len(year)) // 2)
+
+
+def assert_fits_matrix(stats: SeasonRegressionStats, matrix: TrainingMatrix):
+    model, scaler = stats.solve()
+    # The solved model has no imputer, so predict rows without missing values
+    X_test = np.nan_to_num(matrix.X)
+
+    np.testing.assert_allclose(
+        model.predict(scaler.transform(X_test)),
+        fit_and_predict(matrix.X, matrix.y, X_test),
+        rtol=1e-8,
+        atol=1e-8,
+    )
+
+
+def slice_matrix(matrix: TrainingMatrix, end: int) -> TrainingMatrix:
+    return TrainingMatrix(
+        matrix.X[:end],
+        matrix.y[:end],
+        matrix.year[:end],
+        matrix.week[:end],
+        matrix.game[:end],
+    )
+
+
+@pytest.fixture
+def stats_path(tmp_path) -> str:
+    return str(tmp_path / "regression_stats.npz")
+
+
+def test_adds_rest_of_partial_week(stats_path):
+    matrix = make_matrix()
+    # Up to the middle of the last week
+    partial = slice_matrix(matrix, len(matrix.y) - ROWS_PER_WEEK // 2)
+
+    stats = SeasonRegressionStats()
+    assert stats.update(partial) == len(partial.y)
+    stats.save(stats_path)
+
+    stats = SeasonRegressionStats.load(stats_path)
+    # The last week's rows changed, so its season is summed again
+    assert stats.update(matrix) == len(WEEKS) * ROWS_PER_WEEK
+    assert stats.row_count == len(matrix.y)
+    assert_fits_matrix(stats, matrix)
+
+
+def test_sums_changed_season_again(stats_path):
+    matrix = make_matrix()
+    stats = SeasonRegressionStats()
+    stats.update(matrix)
+    stats.save(stats_path)
+
+    # A game in the first season changed after it was downloaded again
+    matrix.y[3] += 10
+
+    stats = SeasonRegressionStats.load(stats_path)
+    assert stats.update(matrix) == len(WEEKS) * ROWS_PER_WEEK
+    assert_fits_matrix(stats, matrix)
+
+    assert stats.update(matrix) == 0
@@ -0,0 +1,144 @@
+"""
+Fetches the upcoming matchups from a local server serving the sample_data
+fixtures, as they were on 02-10-2024 (the week of the Super Bowl), and checks
+when HttpCache uses, revalidates and replaces its saved responses.
+"""
+
+import json
+from datetime import datetime
+
+import pytest
+
+import nfl_analytics.schedule as schedule
+from nfl_analytics.schedule import HttpCache, Matchup, get_upcoming_matchups
+from tests.http_server import LocalServer, load_sample_data
+
+ESPN_PATH = "v2/sports/football/leagues/nfl/"
+EVENTS = ["event-401547378.json", "event-401547464.json"]
+# The teams in the events. Only DET's document was saved, the others are copies of it.
+TEAMS = {12: "KC", 25: "SF", 29: "CAR"}
+EXPECTED_MATCHUPS = [Matchup("KC", "SF"), Matchup("DET", "CAR")]
+CACHED_PATH = "cached.json"
+TTL = 60  # seconds
+
+
+class SuperBowlWeekDatetime(datetime):
+    @classmethod
+    def utcnow(cls) -> datetime:
+        return datetime(2024, 2, 10, 12)
+
+
+def make_team(team_id: int, abbreviation: str) -> dict:
+    team = load_sample_data("teams-8.json")
+    team["$ref"] = team["$ref"].replace("/teams/8?", f"/teams/{team_id}?")
+    team["abbreviation"] = abbreviation
+    return team
+
+
+@pytest.fixture
+def espn_server(tmp_path, monkeypatch):
+    monkeypatch.setattr(schedule, "HTTP_CACHE", HttpCache(str(tmp_path)))
+    monkeypatch.setattr(schedule, "REQUEST_BACKOFF", 0)
+    monkeypatch.setattr(schedule, "datetime", SuperBowlWeekDatetime)
+
+    season = load_sample_data("season-02-10-2024.json")
+    events = [load_sample_data(filename) for filename in EVENTS]
+    event_list = {
+        "$ref": season["type"]["week"]["events"]["$ref"],
+        "count": len(events),
+        "items": [{"$ref": event["$ref"]} for event in events],
+    }
+
+    with LocalServer() as server:
+        for document in [
+            load_sample_data("blacklist-02-10-2024.json"),
+            season,
+            event_list,
+            *events,
+            load_sample_data("teams-8.json"),
+            *[make_team(team_id, abbr) for team_id, abbr in TEAMS.items()],
+        ]:
+            server.add_espn_document(document)
+
+        yield server
+
+
+def test_upcoming_matchups(espn_server):
+    matchups = get_upcoming_matchups(espn_server.url + ESPN_PATH)
+
+    assert matchups == EXPECTED_MATCHUPS
+    # Each team is fetched once
+    assert len(espn_server.requests[f"{ESPN_PATH}seasons/2023/teams/8"]) == 1
+
+
+def test_upcoming_matchups_retries_server_error(espn_server):
+    event_path = f"{ESPN_PATH}events/401547464"
+    espn_server.fail(event_path, 503)
+
+    matchups = get_upcoming_matchups(espn_server.url + ESPN_PATH)
+
+    assert matchups == EXPECTED_MATCHUPS
+    assert len(espn_server.requests[event_path]) == 2
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """The time HttpCache sees, which only changes when a test advances it."""
+    now = [1_700_000_000.0]
+    monkeypatch.setattr(schedule.time, "time", lambda: now[0])
+    return now
+
+
+@pytest.fixture
+def cached_server():
+    with LocalServer() as server:
+        server.add(CACHED_PATH, json.dumps({"version": 1}).encode(), '"v1"')
+        yield server
+
+
+def test_http_cache_revalidates_expired_response(cached_server, clock, tmp_path):
+    cache = HttpCache(str(tmp_path))
+    url = cached_server.url + CACHED_PATH
+
+    for _ in range(2):
+        assert cache.get_json(url, TTL) == {"version": 1}
+    assert len(cached_server.requests[CACHED_PATH]) == 1
+
+    clock[0] += TTL
+    # Answered with 304 Not Modified, which restarts the ttl
+    assert cache.get_json(url, TTL) == {"version": 1}
+    assert cached_server.requests[CACHED_PATH][-1]["If-None-Match"] == '"v1"'
+
+    clock[0] += TTL - 1
+    assert cache.get_json(url, TTL) == {"version": 1}
+
+    assert len(cached_server.requests[CACHED_PATH]) == 2
+    assert (cache.hits, cache.revalidations, cache.misses) == (2, 1, 1)
+
+
+def test_http_cache_replaces_changed_response(cached_server, clock, tmp_path):
+    url = cached_server.url + CACHED_PATH
+    assert HttpCache(str(tmp_path)).get_json(url, TTL) == {"version": 1}
+
+    cached_server.add(CACHED_PATH, json.dumps({"version": 2}).encode(), '"v2"')
+    clock[0] += TTL
+
+    # Read from disk by a new cache, like a later run would
+    cache = HttpCache(str(tmp_path))
+    assert cache.get_json(url, TTL) == {"version": 2}
+    assert cache.get_json(url, TTL) == {"version": 2}
+
+    assert len(cached_server.requests[CACHED_PATH]) == 2
+    assert (cache.hits, cache.revalidations, cache.misses) == (1, 0, 1)
+
+
+def test_http_cache_never_expires_without_ttl(cached_server, clock, tmp_path):
+    cache = HttpCache(str(tmp_path))
+    url = cached_server.url + CACHED_PATH
+
+    cache.get_json(url, None)
+    clock[0] += 365 * 24 * 60 * 60
+    cache.get_json(url, None)
+
+    assert len(cached_server.requests[CACHED_PATH]) == 1
+    assert (cache.hits, cache.revalidations, cache.misses) == (1, 0, 1)